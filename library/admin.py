@@ -5,6 +5,7 @@ from .models import Book
 from .models import Reservation
 from .models import Reader
 from .models import CheckedOutBook
+from .models import OutboxEmail
 
 
 class BookAdmin(admin.ModelAdmin):
@@ -26,8 +27,8 @@ class ReaderAdmin(admin.ModelAdmin):
 
 @admin.action(description="Mark selected reservations as inactive if their end date passed")
 def end_reservations(self, request, queryset):
-    for reservation in queryset:
-        reservation.end_reservation()
+    expired_count = queryset.expire()
+    self.message_user(request, f'{expired_count} reservation(s) marked as inactive.')
 
 
 class ReservationAdmin(admin.ModelAdmin):
@@ -51,7 +52,16 @@ class CheckedOutBookAdmin(admin.ModelAdmin):
                      'due_date', 'end_date']
 
 
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status',
+                    'attempts', 'next_attempt_at',
+                    'created_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'recipients']
+
+
 admin.site.register(Book, BookAdmin)
 admin.site.register(Reader, ReaderAdmin)
 admin.site.register(Reservation, ReservationAdmin)
 admin.site.register(CheckedOutBook, CheckedOutBookAdmin)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
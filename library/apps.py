@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from .backends.sqlite3.base import configure_connection
+        from .middleware import install_query_dispatch
+
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_dispatch)
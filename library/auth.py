@@ -0,0 +1,62 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+
+from .fragments import reader_cache_key
+
+DEFAULT_READER_CACHE_TIMEOUT = 5 * 60
+DEFAULT_PASSWORD_HASHING_WORKERS = os.cpu_count() or 1
+
+
+class CachedReaderBackend(ModelBackend):
+    """
+    Authentication backend loading the reader of an authenticated session from the cache.
+
+    AuthenticationMiddleware loads the user of every authenticated request with get_user. This backend keeps a
+    snapshot of the Reader row in the default cache, so a logged-in page view does not query the reader table.
+    Snapshots are dropped whenever a reader is saved or deleted, or their balance is updated, and expire after
+    settings.READER_CACHE_TIMEOUT seconds in any case, which bounds how long a change made in a process which
+    does not share the cache can go unnoticed.
+
+    Example Usage:
+    AUTHENTICATION_BACKENDS = ['library.auth.CachedReaderBackend']
+
+    Note:
+        - The session auth hash is still checked against the snapshot, and saving a new password drops it, so
+          changing the password logs out the other sessions right away in every process sharing the cache.
+        - Snapshots are only used when settings.CACHE_IS_SHARED is true; with a cache kept in process memory a
+          dropped snapshot would live on in the other processes, so readers are loaded from the database.
+    """
+
+    def get_user(self, user_id):
+        if not getattr(settings, 'CACHE_IS_SHARED', False):
+            return super().get_user(user_id)
+        key = reader_cache_key(user_id)
+        reader = cache.get(key)
+        if reader is None:
+            reader = super().get_user(user_id)
+            if reader is not None:
+                cache.set(key, reader, getattr(settings, 'READER_CACHE_TIMEOUT', DEFAULT_READER_CACHE_TIMEOUT))
+        return reader
+
+
+# hashlib releases the GIL while deriving keys, so hashes computed here run in parallel with the event loop and
+# each other, and the pool bounds how many CPUs a burst of signups can take
+password_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', DEFAULT_PASSWORD_HASHING_WORKERS),
+    thread_name_prefix='password')
+
+
+async def amake_password(password):
+    """
+    Hash a password with the default hasher in password_executor, without blocking the event loop.
+
+    :param password: (str) Raw password.
+    :return: The encoded password, as returned by make_password.
+    """
+    return await asyncio.get_running_loop().run_in_executor(password_executor, make_password, password)
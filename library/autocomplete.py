@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+
+DEFAULT_AUTOCOMPLETE_MAX_AGE = 15 * 60
+
+
+def normalize(text):
+    """
+    Normalize text for prefix matching: accents removed, case folded and whitespace collapsed.
+
+    :param text: (str) Title, author or typed query.
+    :return: Normalized text.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    if not text.isascii():
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+class AutocompleteIndex:
+    """
+    In-process prefix index over book titles and authors for search-as-you-type suggestions.
+
+    Titles are kept in a list sorted by their normalized form, with the id and author of every title in parallel
+    arrays, and distinct authors in a second sorted list; author strings are interned, so each is stored once.
+    A lookup is two binary searches (bisect with normalize as the key) followed by a short forward scan, and never
+    touches the database.
+
+    The index is loaded from the database at first use. Book save and delete signals update it incrementally in
+    the process which made the change; other processes pick up such changes when they rebuild their index in a
+    background thread once it is older than settings.AUTOCOMPLETE_MAX_AGE seconds.
+
+    Methods:
+        - suggest(query, limit): Returns titles and authors starting with the query.
+        - update(book_id, title, author): Adds a book or replaces its title and author.
+        - remove(book_id): Removes a book.
+        - clear(): Drops the loaded index; it is loaded again at next use.
+
+    Example Usage:
+    suggestions = autocomplete_index.suggest('lord of', limit=8)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._loaded = False
+        self._loaded_at = 0
+        self._rebuilding = False
+        self._changes = None
+        self._reset()
+
+    def _reset(self):
+        self._titles = []
+        self._title_ids = array('q')
+        self._title_authors = []
+        self._authors = []
+        self._author_counts = Counter()
+
+    def suggest(self, query, limit=8):
+        """
+        Return titles and authors whose normalized form starts with the normalized query.
+
+        :param query: (str) Text typed by the user.
+        :param limit: (int) Maximum number of titles and of authors.
+        :return: Dictionary with 'titles' (list of {'id', 'title', 'author'}) and 'authors' (list of names).
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return {'titles': [], 'authors': []}
+        self._ensure_loaded()
+        with self._lock:
+            titles = []
+            for i in self._scan(self._titles, prefix, limit):
+                titles.append({'id': self._title_ids[i], 'title': self._titles[i], 'author': self._title_authors[i]})
+            authors = [self._authors[i] for i in self._scan(self._authors, prefix, limit)]
+        return {'titles': titles, 'authors': authors}
+
+    def update(self, book_id, title, author):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((book_id, title, author))
+            if self._loaded:
+                self._remove(book_id)
+                self._add(book_id, title, author)
+
+    def remove(self, book_id):
+        self.update(book_id, None, None)
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+            self._reset()
+
+    @staticmethod
+    def _scan(items, prefix, limit):
+        i = bisect_left(items, prefix, key=normalize)
+        end = min(len(items), i + limit)
+        while i < end and normalize(items[i]).startswith(prefix):
+            yield i
+            i += 1
+
+    def _add(self, book_id, title, author):
+        if title is None:
+            return
+        author = sys.intern(author)
+        i = bisect_left(self._titles, normalize(title), key=normalize)
+        self._titles.insert(i, title)
+        self._title_ids.insert(i, book_id)
+        self._title_authors.insert(i, author)
+        if not self._author_counts[author]:
+            insort(self._authors, author, key=normalize)
+        self._author_counts[author] += 1
+
+    def _remove(self, book_id):
+        try:
+            i = self._title_ids.index(book_id)
+        except ValueError:
+            return
+        author = self._title_authors[i]
+        del self._titles[i], self._title_ids[i], self._title_authors[i]
+        self._author_counts[author] -= 1
+        if not self._author_counts[author]:
+            del self._author_counts[author]
+            self._authors.remove(author)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._build_lock:
+                if not self._loaded:
+                    self._rebuild()
+        elif time.monotonic() - self._loaded_at > getattr(settings, 'AUTOCOMPLETE_MAX_AGE',
+                                                           DEFAULT_AUTOCOMPLETE_MAX_AGE):
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        from django.db import connection
+
+        try:
+            with self._build_lock:
+                self._rebuild()
+        finally:
+            connection.close()
+            with self._lock:
+                self._rebuilding = False
+
+    def _rebuild(self):
+        """
+        Load the index from the database and swap it in, replaying the changes made while it was loading.
+        """
+        from .models import Book
+
+        with self._lock:
+            self._changes = []
+        try:
+            entries = sorted((normalize(title), title, book_id, sys.intern(author)) for book_id, title, author
+                             in Book.objects.values_list('pk', 'title', 'author').iterator(chunk_size=5000))
+            author_counts = Counter(entry[3] for entry in entries)
+            with self._lock:
+                self._titles = [entry[1] for entry in entries]
+                self._title_ids = array('q', (entry[2] for entry in entries))
+                self._title_authors = [entry[3] for entry in entries]
+                del entries
+                self._authors = sorted(author_counts, key=normalize)
+                self._author_counts = author_counts
+                self._loaded = True
+                self._loaded_at = time.monotonic()
+                for book_id, title, author in self._changes:
+                    self._remove(book_id)
+                    self._add(book_id, title, author)
+        finally:
+            with self._lock:
+                self._changes = None
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,170 @@
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Book, CheckedOutBook, Reservation
+
+DEFAULT_EXPORT_CHUNK_SIZE = 2000
+
+
+def filter_reservations(queryset, from_date, to_date, only_active):
+    if from_date:
+        queryset = queryset.filter(end_date__gte=from_date)
+    if to_date:
+        queryset = queryset.filter(start_date__lte=to_date)
+    if only_active:
+        queryset = queryset.filter(is_active=True)
+    return queryset
+
+
+def filter_checked_out_books(queryset, from_date, to_date, only_active):
+    if from_date:
+        queryset = queryset.filter(Q(end_date__gte=from_date) | Q(end_date__isnull=True))
+    if to_date:
+        queryset = queryset.filter(start_date__lte=to_date)
+    if only_active:
+        queryset = queryset.filter(end_date__isnull=True)
+    return queryset
+
+
+# name: (model, exported fields, filter function or None if the export cannot be filtered)
+EXPORTS = {
+    'books': (Book, ('id', 'title', 'author', 'isbn', 'publisher', 'pub_year', 'image_url', 'is_available'),
+              None),
+    'reservations': (Reservation, ('id', 'reader__email', 'book__isbn', 'book__title', 'start_date', 'end_date',
+                                   'is_active', 'should_remind', 'add_info'),
+                     filter_reservations),
+    'checked-out-books': (CheckedOutBook, ('id', 'reader__email', 'book__isbn', 'book__title', 'start_date',
+                                           'due_date', 'end_date', 'is_penalty_paid', 'is_counted'),
+                          filter_checked_out_books),
+}
+
+
+def _export_queryset(name, from_date, to_date, only_active):
+    model, fields, filter_queryset = EXPORTS[name]
+    queryset = model.objects.order_by('pk')
+    if filter_queryset is not None:
+        queryset = filter_queryset(queryset, from_date, to_date, only_active)
+    return fields, queryset.values_list(*fields)
+
+
+def export_rows(name, from_date=None, to_date=None, only_active=False, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE):
+    """
+    Return the rows of an export as a lazy iterator.
+
+    Related fields (e.g. book__title) are fetched with joins in the same query, and rows are read from the
+    database cursor chunk_size at a time, so the queryset is never loaded into memory as a whole.
+
+    :param name: (str) Name of the export, a key of EXPORTS.
+    :param from_date: (date) Only rows which end on or after this date (reservations and checkouts).
+    :param to_date: (date) Only rows which start on or before this date (reservations and checkouts).
+    :param only_active: (bool) Only active reservations or books which are still checked out.
+    :param chunk_size: (int) Number of rows fetched from the database at once.
+    :return: Tuple (header, rows), header being the field names and rows an iterator of value tuples.
+    """
+    fields, queryset = _export_queryset(name, from_date, to_date, only_active)
+    return fields, queryset.iterator(chunk_size=chunk_size)
+
+
+def aexport_rows(name, from_date=None, to_date=None, only_active=False, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE):
+    """
+    Return the rows of an export as a lazy async iterator, for responses sent by an ASGI server.
+
+    Like export_rows, but every chunk is fetched in a thread, as QuerySet.aiterator does. QuerySet.aiterator
+    itself cannot be used, since for values_list querysets Django 5.0 runs the query in the event loop.
+
+    :return: Tuple (header, rows), header being the field names and rows an async iterator of value tuples.
+    """
+    fields, queryset = _export_queryset(name, from_date, to_date, only_active)
+    return fields, _aiterate(queryset, chunk_size)
+
+
+async def _aiterate(queryset, chunk_size):
+    rows = None
+
+    def next_chunk():
+        nonlocal rows
+        # the cursor belongs to the connection of the thread, so it is opened in the one fetching the chunks
+        if rows is None:
+            rows = queryset.iterator(chunk_size=chunk_size)
+        return list(islice(rows, chunk_size))
+
+    while chunk := await sync_to_async(next_chunk)():
+        for row in chunk:
+            yield row
+
+
+class _Echo:
+    """File-like object returning what is written to it, so csv.writer produces strings instead of writing."""
+
+    def write(self, value):
+        return value
+
+
+def csv_encoder(header):
+    """
+    Return the CSV header line and a function encoding a list of rows as CSV.
+
+    :param header: (tuple) Column names written as the first line.
+    :return: Tuple (first, encode), first being the header line and encode a function of a list of value tuples.
+    """
+    writer = csv.writer(_Echo())
+    return writer.writerow(header), lambda chunk: ''.join(writer.writerow(row) for row in chunk)
+
+
+def jsonl_encoder(header):
+    """
+    Return a function encoding a list of rows as JSON Lines objects keyed by the header.
+
+    :param header: (tuple) Keys of the objects.
+    :return: Tuple (first, encode), first being empty (JSON Lines has no header) and encode a function of a list
+             of value tuples.
+    """
+    encoder = DjangoJSONEncoder()
+    return '', lambda chunk: ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in chunk)
+
+
+def stream_export(encoder, header, rows, rows_per_chunk=500):
+    """
+    Encode rows, yielding a string for every rows_per_chunk rows to keep the number of writes low.
+
+    :param encoder: (callable) csv_encoder or jsonl_encoder.
+    :param header: (tuple) Field names of the rows.
+    :param rows: (iterable) Value tuples.
+    :param rows_per_chunk: (int) Number of rows encoded into one yielded string.
+    :return: Generator of strings.
+    """
+    first, encode = encoder(header)
+    if first:
+        yield first
+    rows = iter(rows)
+    while chunk := list(islice(rows, rows_per_chunk)):
+        yield encode(chunk)
+
+
+async def astream_export(encoder, header, rows, rows_per_chunk=500):
+    """
+    Encode the rows of an async iterator like stream_export, for StreamingHttpResponse under ASGI.
+
+    :return: Async generator of strings.
+    """
+    first, encode = encoder(header)
+    if first:
+        yield first
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) == rows_per_chunk:
+            yield encode(chunk)
+            chunk = []
+    if chunk:
+        yield encode(chunk)
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_encoder, 'text/csv'),
+    'jsonl': (jsonl_encoder, 'application/jsonl'),
+}
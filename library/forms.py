@@ -1,6 +1,8 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
-from .models import Reader, Reservation
+from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
+from django.template.loader import render_to_string
+from .auth import amake_password
+from .models import Reader, Reservation, OutboxEmail
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
@@ -21,7 +23,8 @@ class SearchForm(forms.Form):
     """
     q = forms.CharField(label="",
                         widget=forms.TextInput(attrs={'class': 'search_text',
-                                                      'placeholder': 'Search by Title, Author or ISBN'}),
+                                                      'placeholder': 'Search by Title, Author or ISBN',
+                                                      'autocomplete': 'off'}),
                         required=False)
 
 
@@ -38,11 +41,13 @@ class UserRegisterForm(UserCreationForm):
 
     Methods:
         - clean(): Custom clean method to perform additional validation on form data.
-        Checks for existing email addresses and ensures a minimum password length.
+        Ensures a minimum password length.
+        - asave(): Saves the new reader, hashing the password once in a thread pool.
 
     Meta:
         - model (Reader): Specifies the User model associated with this form.
         - fields: List of fields to be included in the form.
+        - error_messages: Message shown when the email is taken.
 
     Example usage:
     form = UserRegisterForm(request.POST)
@@ -53,6 +58,8 @@ class UserRegisterForm(UserCreationForm):
 
     Note:
         - This form is designed for registering users in the system and is associated with the Reader user.
+        - A taken email is detected by the model form's uniqueness check, a single lookup on the unique email
+          index.
     """
 
     class Meta:
@@ -64,17 +71,26 @@ class UserRegisterForm(UserCreationForm):
             'password1',
             'password2',
         ]
+        error_messages = {
+            'email': {'unique': 'This Email already exists'},
+        }
 
     def clean(self, *args, **kwargs):
-        email = self.cleaned_data.get('email')
         password = self.cleaned_data.get('password1')
-        email_check = Reader.objects.filter(email=email)
-        if email_check.exists():
-            raise forms.ValidationError('This Email already exists')
-        if len(password) < 5:
+        if password and len(password) < 5:
             raise forms.ValidationError('Your password should have more than 5 characters')
         return super(UserRegisterForm, self).clean(*args, **kwargs)
 
+    async def asave(self):
+        """
+        Save the new reader of a valid form, with the password hashed once by amake_password.
+
+        :return: The saved Reader.
+        """
+        self.instance.password = await amake_password(self.cleaned_data['password1'])
+        await self.instance.asave()
+        return self.instance
+
 
 class ReservationForm(forms.Form):
     """
@@ -96,10 +112,11 @@ class ReservationForm(forms.Form):
          - fields: List of fields to be included in the form.
 
      Methods:
+         - clean(): Rejects periods in which the book (if given) is already reserved or checked out.
          - save(commit=True): Custom save method to create a new Reservation based on the form data.
 
      Example usage:
-     form = ReservationForm(request.POST)
+     form = ReservationForm(request.POST, book=book)
      if form.is_valid():
          # Process and handle reservation creation.
      else:
@@ -129,6 +146,25 @@ class ReservationForm(forms.Form):
                   'should_remind',
                   'add_info']
 
+    def __init__(self, *args, book=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.book = book
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        how_long = cleaned_data.get('how_long')
+        if self.book is not None and start_date and how_long:
+            end_date = start_date + timezone.timedelta(days=how_long)
+            if not self.book.is_free_between(start_date, end_date):
+                next_free_date = self.book.next_free_window(how_long, from_date=start_date)
+                if next_free_date is None:
+                    raise forms.ValidationError('The book is already reserved in this period. It has not been '
+                                                'returned on time, so the date it can be reserved from is unknown.')
+                raise forms.ValidationError(f'The book is already reserved in this period. '
+                                            f'It can be reserved from {next_free_date}.')
+        return cleaned_data
+
     def save(self, commit=True):
         start_date = self.cleaned_data['start_date']
         how_long = self.cleaned_data['how_long']
@@ -179,3 +215,45 @@ class FilterReservationsForm(forms.Form):
     to_date = forms.DateField(label='To:', widget=forms.DateInput(attrs={'type' : 'date',
                                                                          'value' : timezone.now().date() + timezone.timedelta(days=7)}))
     only_active = forms.BooleanField(label='Only active reservations?', initial=True, required=False)
+
+
+class ExportFilterForm(FilterReservationsForm):
+    """
+    Form for filtering and choosing the format of staff exports.
+
+    It has the fields of FilterReservationsForm, but every filter is optional, so an export without parameters
+    contains all rows.
+
+    Attributes:
+        - format (ChoiceField): Output format, CSV (default) or JSON Lines.
+
+    Example usage:
+    form = ExportFilterForm(request.GET)
+    if form.is_valid():
+        header, rows = export_rows('reservations', form.cleaned_data['from_date'], form.cleaned_data['to_date'])
+    """
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['from_date'].required = False
+        self.fields['to_date'].required = False
+
+
+class OutboxPasswordResetForm(PasswordResetForm):
+    """
+    Password reset form which queues the reset email in the outbox instead of sending it.
+
+    The email is rendered exactly as by Django's PasswordResetForm and sent later by the send_outbox command,
+    so the request does not wait for the mail server.
+
+    Example usage:
+    path('password-reset/', auth_views.PasswordResetView.as_view(form_class=OutboxPasswordResetForm))
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html_body = render_to_string(html_email_template_name, context) if html_email_template_name else ''
+        OutboxEmail.objects.enqueue(subject, body, [to_email], from_email=from_email, html_body=html_body)
@@ -0,0 +1,137 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .metrics import record_cache
+
+DEFAULT_BOOK_FRAGMENT_TIMEOUT = 60 * 60 * 24
+DEFAULT_LOCAL_FRAGMENT_TIMEOUT = 5
+DEFAULT_ACCOUNT_HISTORY_TIMEOUT = 60 * 60 * 24
+
+
+def fragment_timeout():
+    """
+    Return how long fragments and versions are cached.
+
+    Invalidations only reach the processes which share the default cache, so when it is kept in process memory
+    (settings.CACHE_IS_SHARED is false) the timeout is capped to settings.LOCAL_FRAGMENT_TIMEOUT seconds, which
+    bounds how long another process can serve a stale fragment.
+
+    :return: Timeout in seconds.
+    """
+    timeout = getattr(settings, 'BOOK_FRAGMENT_TIMEOUT', DEFAULT_BOOK_FRAGMENT_TIMEOUT)
+    if not getattr(settings, 'CACHE_IS_SHARED', False):
+        timeout = min(timeout, getattr(settings, 'LOCAL_FRAGMENT_TIMEOUT', DEFAULT_LOCAL_FRAGMENT_TIMEOUT))
+    return timeout
+
+
+def version_key(kind, pk):
+    return f'library:{kind}-version:{pk}'
+
+
+async def aversions(kind, pks):
+    """
+    Return the current fragment versions of objects.
+
+    A version is part of the cache key of every fragment rendered from an object, so changing it makes all of
+    them stale at once. An object without a version, because it was never rendered, was invalidated or its
+    version was evicted, gets a new one based on the current time, so a version is never reused for different
+    content. Versions expire with the fragments (see fragment_timeout), so ids which are requested once, or
+    do not exist at all, do not occupy the cache for good.
+
+    :param kind: (str) Kind of the objects, 'book' or 'reader'.
+    :param pks: (iterable) Primary keys of the objects.
+    :return: Dictionary mapping primary keys to versions, fetched in one cache round trip when all versions exist.
+    """
+    keys = {version_key(kind, pk): pk for pk in pks}
+    found = await cache.aget_many(keys)
+    for key in keys.keys() - found.keys():
+        found[key] = await cache.aget_or_set(key, time.time_ns(), fragment_timeout())
+    return {pk: found[key] for key, pk in keys.items()}
+
+
+def invalidate(kind, pks):
+    """
+    Make all cached fragments of objects stale by dropping their versions.
+
+    :param kind: (str) Kind of the objects, 'book' or 'reader'.
+    :param pks: (iterable) Primary keys of the changed objects.
+    """
+    cache.delete_many([version_key(kind, pk) for pk in pks])
+
+
+async def abook_versions(book_ids):
+    return await aversions('book', book_ids)
+
+
+def invalidate_books(book_ids):
+    invalidate('book', book_ids)
+
+
+def invalidate_readers(reader_ids):
+    invalidate('reader', reader_ids)
+
+
+def reader_cache_key(reader_id):
+    return f'library:reader:{reader_id}'
+
+
+def invalidate_reader_snapshots(reader_ids):
+    """
+    Drop the Reader rows cached by CachedReaderBackend, so the next request of the readers loads them again.
+
+    :param reader_ids: (iterable) Primary keys of the changed readers.
+    """
+    cache.delete_many([reader_cache_key(pk) for pk in reader_ids])
+
+
+async def arender_book_rows(books):
+    """
+    Render the search result rows of books, reusing cached rows of unchanged books.
+
+    Versions and rows are fetched with one get_many each; only missing rows are rendered and stored.
+
+    :param books: (list) Book objects in display order.
+    :return: List of rendered rows (safe HTML strings) in the same order.
+    """
+    versions = await abook_versions(book.pk for book in books)
+    keys = [f'library:book-row:{book.pk}:{versions[book.pk]}' for book in books]
+    rows = await cache.aget_many(keys)
+    missing = {}
+    for book, key in zip(books, keys):
+        hit = key in rows
+        record_cache('book_row', hit)
+        if not hit:
+            missing[key] = rows[key] = render_to_string('book_row.html', {'book': book})
+    if missing:
+        await cache.aset_many(missing, fragment_timeout())
+    return [rows[key] for key in keys]
+
+
+async def aaccount_history(reader_id, filters, render):
+    """
+    Return the rendered account history of a reader, rendering it only if it is not cached yet.
+
+    Entries are keyed by the reader, their version, the current date and the filters, and stored in the
+    'account' cache, which should be bounded (e.g. LocMemCache with MAX_ENTRIES evicts the least recently used
+    entries). The reader version is changed whenever their reservations, checkouts or balance change.
+
+    :param reader_id: (int) Primary key of the reader.
+    :param filters: (tuple) Values of the applied filters (from_date, to_date, only_active).
+    :param render: (callable) Coroutine function called without arguments to render the history when it is not
+                   cached.
+    :return: Whatever render returned for this reader, version, date and filters.
+    """
+    version = (await aversions('reader', [reader_id]))[reader_id]
+    key = ':'.join(map(str, ('library:account', reader_id, version, timezone.now().date(), *filters)))
+    account_cache = caches['account']
+    history = await account_cache.aget(key)
+    record_cache('account', history is not None)
+    if history is None:
+        history = await render()
+        await account_cache.aset(key, history,
+                                 getattr(settings, 'ACCOUNT_HISTORY_TIMEOUT', DEFAULT_ACCOUNT_HISTORY_TIMEOUT))
+    return history
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connections
+from django.db.utils import DatabaseError
+
+BOOK_TABLE = 'library_book'
+BOOK_FTS_TABLE = 'library_book_fts'
+BOOK_FTS_COLUMNS = ('title', 'author', 'publisher', 'isbn')
+# bm25() column weights, in BOOK_FTS_COLUMNS order: a hit in the title ranks above a hit in the publisher.
+BOOK_FTS_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+_columns = ', '.join(BOOK_FTS_COLUMNS)
+_new_values = ', '.join('new.%s' % column for column in BOOK_FTS_COLUMNS)
+_old_values = ', '.join('old.%s' % column for column in BOOK_FTS_COLUMNS)
+
+BOOK_FTS_CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {BOOK_FTS_TABLE} USING fts5("
+    f"{_columns}, content='{BOOK_TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_ai AFTER INSERT ON {BOOK_TABLE} BEGIN "
+    f"INSERT INTO {BOOK_FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_ad AFTER DELETE ON {BOOK_TABLE} BEGIN "
+    f"INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_au AFTER UPDATE OF {_columns} ON {BOOK_TABLE} BEGIN "
+    f"INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {BOOK_FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+    f"END",
+    f"INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+BOOK_FTS_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {BOOK_FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {BOOK_FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {BOOK_FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {BOOK_FTS_TABLE}",
+]
+
+_fts_enabled = {}
+
+
+def fts5_supported(connection):
+    """
+    Check whether the database behind the given connection can host an FTS5 table.
+
+    :param connection: Database connection wrapper.
+    :return: True for SQLite builds compiled with FTS5, False otherwise.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def install_book_fts(schema_editor):
+    """
+    Create the book full-text index and the triggers keeping it in sync, then index existing books.
+
+    Does nothing on backends without FTS5, where search falls back to the ORM filter.
+    The statements are idempotent, so they can be re-run by migrations which rebuild the book table
+    (SQLite drops a table's triggers together with the table).
+
+    :param schema_editor: Schema editor of the running migration.
+    """
+    if not fts5_supported(schema_editor.connection):
+        return
+    for sql in BOOK_FTS_CREATE_SQL:
+        schema_editor.execute(sql)
+    _fts_enabled.pop(schema_editor.connection.alias, None)
+
+
+def uninstall_book_fts(schema_editor):
+    """
+    Drop the book full-text index and its triggers.
+
+    :param schema_editor: Schema editor of the running migration.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in BOOK_FTS_DROP_SQL:
+        schema_editor.execute(sql)
+    _fts_enabled.pop(schema_editor.connection.alias, None)
+
+
+def book_fts_enabled(using='default'):
+    """
+    Check whether the book full-text index exists in the given database.
+
+    The result is cached per database alias for the lifetime of the process.
+
+    :param using: (str) Database alias.
+    :return: True if book search can use the full-text index.
+    """
+    if using not in _fts_enabled:
+        connection = connections[using]
+        enabled = False
+        if connection.vendor == 'sqlite':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                                   [BOOK_FTS_TABLE])
+                    enabled = cursor.fetchone() is not None
+            except DatabaseError:
+                enabled = False
+        _fts_enabled[using] = enabled
+    return _fts_enabled[using]
+
+
+def build_match_query(query):
+    """
+    Translate a user search query into an FTS5 MATCH expression.
+
+    Every word of the query becomes a quoted prefix term, so "dun herb" matches "Dune" by "Frank Herbert".
+    Quoting the terms keeps FTS5 operators and punctuation typed by users from being interpreted.
+
+    :param query: (str) Search query entered by the user.
+    :return: MATCH expression, or an empty string if the query contains no searchable words.
+    """
+    return ' '.join('"%s"*' % term for term in re.findall(r'\w+', query))
@@ -0,0 +1,164 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+
+from .fragments import invalidate_books
+from .models import Book
+
+BOOK_IMPORT_FIELDS = ('title', 'author', 'isbn', 'publisher', 'pub_year', 'image_url')
+BOOK_UPDATE_FIELDS = ('title', 'author', 'publisher', 'pub_year', 'image_url', 'updated_at')
+validate_url = URLValidator()
+
+
+def read_csv(file):
+    """
+    Stream rows of a CSV file with a header line.
+
+    :param file: Text file object.
+    :return: Generator of (line_number, row) tuples, row being a dictionary.
+    """
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(file):
+    """
+    Stream rows of a JSON Lines file, one JSON object per line. Blank lines are skipped.
+
+    :param file: Text file object.
+    :return: Generator of (line_number, row) tuples; row is None for lines which are not a JSON object.
+    """
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def normalize_isbn(value):
+    """
+    Normalize an ISBN-10 or ISBN-13 and verify its check digit.
+
+    :param value: (str) ISBN, possibly with hyphens or spaces.
+    :return: The ISBN without separators.
+    :raises ValidationError: If the ISBN is malformed or its check digit is wrong.
+    """
+    isbn = str(value).replace('-', '').replace(' ', '').upper()
+    if len(isbn) == 13 and isbn.isdigit():
+        checksum = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(isbn))
+        valid = checksum % 10 == 0
+    elif len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        checksum = sum((10 - i) * (10 if digit == 'X' else int(digit)) for i, digit in enumerate(isbn))
+        valid = checksum % 11 == 0
+    else:
+        raise ValidationError(f'"{value}" is not an ISBN-10 or ISBN-13.')
+    if not valid:
+        raise ValidationError(f'"{value}" has a wrong check digit.')
+    return isbn
+
+
+def clean_book_row(row):
+    """
+    Validate an imported row and convert it to Book field values.
+
+    :param row: (dict) Raw row with the BOOK_IMPORT_FIELDS keys.
+    :return: Dictionary of cleaned field values.
+    :raises ValidationError: With all problems of the row.
+    """
+    if row is None:
+        raise ValidationError('Not a JSON object.')
+    errors = []
+    cleaned = {}
+    for name in BOOK_IMPORT_FIELDS:
+        value = row.get(name)
+        value = value.strip() if isinstance(value, str) else value
+        try:
+            if value in (None, ''):
+                raise ValidationError('missing.')
+            if name == 'isbn':
+                value = normalize_isbn(value)
+            elif name == 'pub_year':
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValidationError(f'"{value}" is not a year.')
+            else:
+                value = str(value)
+                max_length = Book._meta.get_field(name).max_length
+                if len(value) > max_length:
+                    raise ValidationError(f'longer than {max_length} characters.')
+                if name == 'image_url':
+                    validate_url(value)
+        except ValidationError as error:
+            errors.extend(f'{name}: {message}' for message in error.messages)
+        else:
+            cleaned[name] = value
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+class BookImporter:
+    """
+    Imports books from a stream of rows, inserting new ISBNs and updating the books with known ones.
+
+    Rows are validated one by one and written in chunks with bulk_create(update_conflicts=True), each chunk in
+    its own transaction, so memory use does not grow with the size of the file. Within a chunk, the last row
+    of a repeated ISBN wins. Availability of existing books is never changed.
+
+    Attributes:
+        - batch_size (int): Number of rows per bulk_create and transaction.
+        - progress (callable): Called with a message after every chunk, e.g. self.stdout.write.
+        - error (callable): Called with a message for every invalid row.
+        - imported (int): Number of rows written so far.
+        - invalid (int): Number of rows skipped so far.
+
+    Methods:
+        - run(rows): Imports (line_number, row) tuples, e.g. from read_csv or read_jsonl.
+
+    Example Usage:
+    with open('catalog.csv', newline='', encoding='utf-8') as file:
+        importer = BookImporter()
+        importer.run(read_csv(file))
+    """
+
+    def __init__(self, batch_size=2000, progress=None, error=None):
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.error = error or (lambda message: None)
+        self.imported = 0
+        self.invalid = 0
+
+    def run(self, rows):
+        started = time.perf_counter()
+        books = self._valid_books(rows)
+        while True:
+            chunk = {book.isbn: book for book in islice(books, self.batch_size)}
+            if not chunk:
+                break
+            with transaction.atomic():
+                created = Book.objects.bulk_create(chunk.values(), update_conflicts=True, unique_fields=['isbn'],
+                                                   update_fields=BOOK_UPDATE_FIELDS)
+            # bulk_create sends no signals, so cached fragments of updated books are invalidated here
+            invalidate_books(book.pk for book in created if book.pk is not None)
+            self.imported += len(chunk)
+            elapsed = time.perf_counter() - started
+            self.progress(f'books: {self.imported} imported, {self.invalid} invalid '
+                          f'({self.imported / elapsed:,.0f} rows/s)')
+
+    def _valid_books(self, rows):
+        for line_number, row in rows:
+            try:
+                yield Book(**clean_book_row(row))
+            except ValidationError as error:
+                self.invalid += 1
+                self.error(f'Line {line_number}: {" ".join(error.messages)}')
@@ -0,0 +1,187 @@
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from library.models import Book, CheckedOutBook, Reader, Reservation
+from library.seeding import WORDS, LibrarySeeder
+
+BENCH_PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    """
+    Management command benchmarking the library views.
+
+    The command creates a throwaway test database, seeds it with a configurable dataset and drives the views
+    through the Django test client. For every view it reports p50/p95/p99 latency, the number of SQL queries per
+    request and the peak memory allocated while serving one request. Results can be saved as JSON and compared
+    with an earlier run, failing when a view got slower than the allowed regression or runs more queries.
+
+    Example Usage:
+    python manage.py bench --books 5000 --output before.json
+    python manage.py bench --books 5000 --output after.json --compare before.json --max-regression 0.2
+
+    Note:
+        - Latency is measured without tracemalloc; memory is measured in a separate, shorter pass.
+        - Timings include the whole request cycle (middleware, view, template), but not a real web server.
+    """
+    help = 'Benchmark the library views on a seeded throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000, help='Number of books to seed (default: 2000).')
+        parser.add_argument('--readers', type=int, default=50, help='Number of readers to seed (default: 50).')
+        parser.add_argument('--history', type=int, default=50,
+                            help='Reservations and checkouts of the benchmarked reader (default: 50).')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Timed requests per view (default: 50).')
+        parser.add_argument('--memory-requests', type=int, default=5,
+                            help='Requests per view traced for peak memory (default: 5).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with.')
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help='Fail if the p95 latency of a view grew by more than this fraction '
+                                 'of the compared run (e.g. 0.2 for 20%%), or if it runs more queries.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('--requests must be at least 2 to compute percentiles.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        rng = random.Random(options['seed'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            reader = self.seed(rng, options)
+            results = self.run_benchmarks(rng, reader, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                **{key: options[key] for key in ('books', 'readers', 'history', 'requests', 'seed')},
+            },
+            'views': results,
+        }
+        self.print_results(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+        if baseline is not None and options['max_regression'] is not None:
+            regressions = self.find_regressions(results, baseline['views'], options['max_regression'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+
+    def seed(self, rng, options):
+        seeder = LibrarySeeder(rng)
+        seeder.seed_books(options['books'])
+        seeder.seed_readers(max(options['readers'], 1), BENCH_PASSWORD)
+        reader = Reader.objects.get(pk=seeder.reader_ids[0])
+        book_ids = seeder.book_ids
+        today = timezone.now().date()
+        reservations, checked_out_books = [], []
+        for i in range(options['history']):
+            start_date = today - timezone.timedelta(days=10 * (i + 1))
+            reservations.append(Reservation(reader=reader, book_id=rng.choice(book_ids), start_date=start_date,
+                                            end_date=start_date + timezone.timedelta(days=3)))
+            checked_out_books.append(CheckedOutBook(
+                reader=reader, book_id=rng.choice(book_ids), start_date=start_date,
+                due_date=start_date + timezone.timedelta(days=14),
+                end_date=start_date + timezone.timedelta(days=rng.randrange(7, 21))))
+        Reservation.objects.bulk_create(reservations)
+        CheckedOutBook.objects.bulk_create(checked_out_books)
+        return reader
+
+    def run_benchmarks(self, rng, reader, options):
+        anonymous = Client()
+        logged_in = Client()
+        logged_in.force_login(reader)
+        book_ids = list(Book.objects.values_list('pk', flat=True))
+        scenarios = {
+            'index': lambda: anonymous.get(reverse('index')),
+            'search_results': lambda: anonymous.get(reverse('search_results'), {'q': rng.choice(WORDS)}),
+            'book_view': lambda: anonymous.get(reverse('book', kwargs={'book_id': rng.choice(book_ids)})),
+            'account': lambda: logged_in.get(reverse('account')),
+            'login': lambda: Client().post(reverse('login'), {'username': reader.email,
+                                                              'password': BENCH_PASSWORD}),
+        }
+        results = {}
+        for name, request in scenarios.items():
+            self.stdout.write(f'Benchmarking {name}...')
+            response = request()
+            if response.status_code >= 400:
+                raise CommandError(f'{name} returned HTTP {response.status_code}.')
+            results[name] = self.measure(request, options['requests'], options['memory_requests'])
+        return results
+
+    def measure(self, request, requests, memory_requests):
+        latencies = []
+        query_counts = []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                request()
+                latencies.append((time.perf_counter() - start) * 1000)
+            query_counts.append(len(queries))
+
+        peak_memory = 0
+        tracemalloc.start()
+        try:
+            for _ in range(memory_requests):
+                tracemalloc.reset_peak()
+                request()
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'requests': requests,
+            'p50_ms': round(percentiles[49], 3),
+            'p95_ms': round(percentiles[94], 3),
+            'p99_ms': round(percentiles[98], 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': max(query_counts),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    def print_results(self, results, baseline):
+        self.stdout.write(f'{"view":<16}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}{"peak KiB":>10}'
+                          + (f'{"p95 vs base":>13}' if baseline else ''))
+        for name, result in results.items():
+            line = (f'{name:<16}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                    f'{result["queries"]:>9}{result["peak_memory_kb"]:>10.1f}')
+            base = baseline['views'].get(name) if baseline else None
+            if base:
+                line += f'{(result["p95_ms"] / base["p95_ms"] - 1) * 100:>+12.1f}%'
+            self.stdout.write(line)
+
+    def find_regressions(self, results, baseline, max_regression):
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + max_regression):
+                regressions.append(f'{name}: p95 {base["p95_ms"]:.2f} ms -> {result["p95_ms"]:.2f} ms')
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: {base["queries"]} -> {result["queries"]} queries per request')
+        return regressions
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.models import Reservation
+
+
+class Command(BaseCommand):
+    """
+    Management command ending all past-due reservations and activating the ones which have started.
+
+    The command is idempotent and works in short chunked transactions, so it can be run periodically from cron
+    while the site is serving traffic.
+
+    Example Usage:
+    python manage.py expire_reservations --batch-size 1000
+    """
+    help = ('Deactivate reservations whose end date has passed and make their books available again, '
+            'and activate reservations which have started.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of reservations ended per transaction (default: 500).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number.')
+        expired_count = Reservation.objects.expire(batch_size=options['batch_size'])
+        activated_count = Reservation.objects.activate_started()
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired_count} and activated {activated_count} '
+                                             f'reservation(s).'))
@@ -0,0 +1,58 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importing import BookImporter, read_csv, read_jsonl
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class Command(BaseCommand):
+    """
+    Management command importing a book catalog from a CSV or JSON Lines file.
+
+    Rows need the title, author, isbn, publisher, pub_year and image_url fields (a header line in CSV files).
+    Books with a new ISBN are inserted and books with a known ISBN are updated. The file is streamed and written
+    in chunks, each in its own transaction, so files of any size are imported in bounded memory. Invalid rows
+    are reported with their line number and skipped.
+
+    Example Usage:
+    python manage.py import_books catalog.csv
+    python manage.py import_books - --format jsonl < catalog.jsonl
+    """
+    help = 'Import books from a CSV or JSON Lines file, updating books with known ISBNs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - to read standard input.')
+        parser.add_argument('--format', choices=READERS,
+                            help='File format (default: guessed from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk insert and transaction (default: 2000).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number.')
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else None
+        if file_format is None:
+            raise CommandError('Cannot guess the file format, please pass --format.')
+
+        started = time.perf_counter()
+        importer = BookImporter(batch_size=options['batch_size'],
+                                progress=lambda message: self.stdout.write(f'\r{message}', ending=''),
+                                error=lambda message: self.stderr.write(f'\n{message}'))
+        try:
+            if path == '-':
+                importer.run(READERS[file_format](sys.stdin))
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as file:
+                    importer.run(READERS[file_format](file))
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Imported {importer.imported} book(s) in '
+                                             f'{time.perf_counter() - started:.1f} s, '
+                                             f'skipped {importer.invalid} invalid row(s).'))
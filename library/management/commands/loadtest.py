@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Management command generating HTTP load against a running server, e.g. to compare WSGI and ASGI deployments.
+
+    A number of concurrent keep-alive connections request the given URLs in turn for a fixed duration and the
+    command reports throughput and latency percentiles. Slow clients can be simulated as well: they keep their
+    connection open by sending the headers of a request one line at a time and never finishing it, as a client
+    on a bad mobile network would. A server with a thread per connection ties up one thread for each of them,
+    while an event loop based server keeps serving the other clients.
+
+    The client is written with asyncio streams and needs no extra packages. It only speaks plain HTTP/1.1, so
+    it is meant for servers on localhost or behind a private network.
+
+    Example Usage:
+    gunicorn wap_project.wsgi -k gthread --threads 8 -b 127.0.0.1:8000
+    uvicorn wap_project.asgi:application --port 8001
+    python manage.py loadtest http://127.0.0.1:8000/library/books/1 --concurrency 50 --slow-clients 100
+    python manage.py loadtest http://127.0.0.1:8001/library/books/1 --concurrency 50 --slow-clients 100
+
+    Note:
+        - Latency includes the wait for a free connection on the server side, not the client's own scheduling.
+        - The client runs in one process; at high request rates it can be the bottleneck, so keep it on a core
+          of its own (e.g. with taskset) when comparing servers.
+    """
+    help = 'Generate HTTP load against a running server and report throughput and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='URLs requested in turn; all must be on the same host.')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Number of concurrent keep-alive connections (default: 50).')
+        parser.add_argument('--duration', type=float, default=10, help='Duration in seconds (default: 10).')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Number of connections trickling an unfinished request (default: 0).')
+        parser.add_argument('--slow-interval', type=float, default=1.0,
+                            help='Seconds between the header lines sent by slow clients (default: 1).')
+        parser.add_argument('--header', action='append', default=[],
+                            help='Extra request header, e.g. "Cookie: sessionid=..."; can be repeated.')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout of one request (default: 30).')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive.')
+        targets = [urlsplit(url) for url in options['urls']]
+        if any(target.scheme != 'http' for target in targets):
+            raise CommandError('Only http:// URLs are supported.')
+        if len({target.netloc for target in targets}) > 1:
+            raise CommandError('All URLs must be on the same host.')
+        for header in options['header']:
+            if ':' not in header:
+                raise CommandError(f'Invalid header "{header}", expected "Name: value".')
+
+        results = asyncio.run(LoadTest(targets, options).run())
+        self.print_results(results, options)
+
+    def print_results(self, results, options):
+        latencies = results['latencies']
+        elapsed = results['elapsed']
+        self.stdout.write(f'{len(latencies)} requests in {elapsed:.1f} s over {options["concurrency"]} connections, '
+                          f'{options["slow_clients"]} slow clients ({results["slow_connected"]} connected)')
+        self.stdout.write(f'{"requests/s":<14}{len(latencies) / elapsed:>10.1f}')
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+            for name, value in (('p50 ms', percentiles[49]), ('p95 ms', percentiles[94]),
+                                ('p99 ms', percentiles[98]), ('max ms', max(latencies))):
+                self.stdout.write(f'{name:<14}{value:>10.2f}')
+        self.stdout.write(f'{"statuses":<14}{dict(sorted(results["statuses"].items()))}')
+        if results['errors']:
+            self.stdout.write(self.style.WARNING(f'{"errors":<14}{dict(results["errors"])}'))
+
+
+class LoadTest:
+    """
+    One load test run: the keep-alive workers and slow clients of the loadtest command.
+    """
+
+    def __init__(self, targets, options):
+        self.host = targets[0].hostname
+        self.port = targets[0].port or 80
+        headers = ''.join(f'{name.strip()}: {value.strip()}\r\n' for name, value in
+                          (header.split(':', 1) for header in options['header']))
+        self.requests = itertools.cycle([
+            (f'GET {target.path or "/"}{"?" + target.query if target.query else ""} HTTP/1.1\r\n'
+             f'Host: {target.netloc}\r\n{headers}\r\n').encode('latin-1')
+            for target in targets])
+        self.options = options
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.slow_connected = 0
+
+    async def run(self):
+        self.deadline = time.monotonic() + self.options['duration']
+        slow_clients = [asyncio.create_task(self.slow_client()) for _ in range(self.options['slow_clients'])]
+        # give slow clients the chance to take their connections first, as they would on a busy server
+        await asyncio.sleep(min(1.0, self.options['duration'] / 10) if slow_clients else 0)
+        started = time.monotonic()
+        await asyncio.gather(*(self.worker() for _ in range(self.options['concurrency'])))
+        elapsed = time.monotonic() - started
+        for task in slow_clients:
+            task.cancel()
+        await asyncio.gather(*slow_clients, return_exceptions=True)
+        return {'latencies': self.latencies, 'elapsed': elapsed, 'statuses': self.statuses,
+                'errors': self.errors, 'slow_connected': self.slow_connected}
+
+    async def worker(self):
+        reader = writer = None
+        while time.monotonic() < self.deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                start = time.perf_counter()
+                writer.write(next(self.requests))
+                status, keep_alive = await asyncio.wait_for(self.read_response(reader), self.options['timeout'])
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                self.statuses[status] += 1
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+                self.errors[type(error).__name__] += 1
+                keep_alive = False
+                await asyncio.sleep(0.01)
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    @staticmethod
+    async def read_response(reader):
+        """
+        Read one HTTP/1.1 response, with a Content-Length or chunked body.
+
+        :return: Tuple (status, keep_alive).
+        """
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        if headers.get('transfer-encoding') == 'chunked':
+            while size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                await reader.readexactly(size + 2)
+            while await reader.readuntil(b'\r\n') != b'\r\n':
+                pass
+        else:
+            await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers.get('connection') != 'close'
+
+    async def slow_client(self):
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self.slow_connected += 1
+            writer.write(next(self.requests).split(b'\r\n', 1)[0] + b'\r\n')
+            for line_number in itertools.count():
+                await asyncio.sleep(self.options['slow_interval'])
+                writer.write(f'X-Slow-Client: {line_number}\r\n'.encode('latin-1'))
+                await writer.drain()
+        except OSError:
+            self.errors['slow client OSError'] += 1
+        finally:
+            if writer is not None:
+                writer.close()
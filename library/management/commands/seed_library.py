@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.seeding import LibrarySeeder
+
+
+class Command(BaseCommand):
+    """
+    Management command filling the database with generated library data for load testing.
+
+    The same --seed always generates the same data. Rows are written with chunked bulk_create calls, each in its
+    own transaction, so even millions of rows are generated in bounded memory.
+
+    Example Usage:
+    python manage.py seed_library --books 1000000 --readers 100000 --history 10 --seed 42
+    """
+    help = 'Generate books, readers, reservations and checkouts for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Number of books (default: 10000).')
+        parser.add_argument('--readers', type=int, default=1000, help='Number of readers (default: 1000).')
+        parser.add_argument('--history', type=float, default=10,
+                            help='Mean number of reservations and of checkouts per reader (default: 10).')
+        parser.add_argument('--late-ratio', type=float, default=0.2,
+                            help='Fraction of checkouts returned late (default: 0.2).')
+        parser.add_argument('--days', type=int, default=730,
+                            help='Length of the generated history in days (default: 730).')
+        parser.add_argument('--skew', type=float, default=2.0,
+                            help='Popularity skew of books, 1 for uniform (default: 2.0).')
+        parser.add_argument('--password', default='password',
+                            help='Password of all generated readers (default: "password").')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert and transaction (default: 5000).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number.')
+        if options['skew'] < 1 or not 0 <= options['late_ratio'] <= 1:
+            raise CommandError('--skew must be at least 1 and --late-ratio between 0 and 1.')
+
+        started = time.perf_counter()
+        seeder = LibrarySeeder(random.Random(options['seed']), batch_size=options['batch_size'],
+                               progress=lambda message: self.stdout.write(f'\r{message}', ending=''))
+        seeder.seed_books(options['books'])
+        self.stdout.write('')
+        seeder.seed_readers(options['readers'], options['password'])
+        self.stdout.write('')
+        seeder.seed_history(per_reader=options['history'], late_ratio=options['late_ratio'],
+                            days=options['days'], skew=options['skew'])
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Seeded the library in {time.perf_counter() - started:.1f} s.'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.outbox import send_outbox_batch
+
+
+class Command(BaseCommand):
+    """
+    Management command draining the email outbox.
+
+    By default the command sends everything that is due and exits, which suits cron. With --loop it keeps running
+    as a worker and polls the outbox every --interval seconds when it is empty.
+
+    Example Usage:
+    python manage.py send_outbox --loop --interval 5
+    """
+    help = 'Send queued emails from the outbox, retrying failed ones with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of emails sent over one connection (default: 100).')
+        parser.add_argument('--max-attempts', type=int, default=None,
+                            help='Delivery attempts before an email is marked as failed '
+                                 '(default: settings.OUTBOX_MAX_ATTEMPTS or 5).')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll the outbox instead of exiting when it is empty.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait between polls of an empty outbox with --loop (default: 5).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number.')
+        total_sent = total_failed = 0
+        while True:
+            sent_count, failed_count = send_outbox_batch(batch_size=options['batch_size'],
+                                                         max_attempts=options['max_attempts'])
+            total_sent += sent_count
+            total_failed += failed_count
+            if sent_count or failed_count:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} email(s), {total_failed} attempt(s) failed.'))
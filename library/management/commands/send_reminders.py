@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.reminders import send_reservation_reminders
+
+
+class Command(BaseCommand):
+    """
+    Management command sending reminder emails for upcoming reservations.
+
+    Reminders are marked as sent, so the command can be run repeatedly (e.g. every morning from cron)
+    without sending any reminder twice.
+
+    Example Usage:
+    python manage.py send_reminders --batch-size 200 --workers 4
+    """
+    help = 'Send reminder emails for reservations starting soon.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of reminders read and claimed at once (default: 100).')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of threads sending emails, each over one connection (default: 4).')
+        parser.add_argument('--lead-days', type=int, default=None,
+                            help='Remind about reservations starting within this many days '
+                                 '(default: settings.RESERVATION_REMINDER_LEAD_DAYS or 1).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive numbers.')
+        sent_count, failed_count = send_reservation_reminders(batch_size=options['batch_size'],
+                                                              workers=options['workers'],
+                                                              lead_days=options['lead_days'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent_count} reminder(s).'))
+        if failed_count:
+            self.stderr.write(f'{failed_count} reminder(s) could not be sent and will be retried on the next run.')
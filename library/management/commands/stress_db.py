@@ -0,0 +1,223 @@
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from library.backends.sqlite3.base import DEFAULT_SQLITE_PRAGMAS
+from library.models import Book, CheckedOutBook, Reader, Reservation
+from library.seeding import LibrarySeeder
+
+# (engine, pragmas) of the compared database configurations
+PROFILES = {
+    'stock': ('django.db.backends.sqlite3', {}),
+    'library': ('library.backends.sqlite3', DEFAULT_SQLITE_PRAGMAS),
+}
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Command(BaseCommand):
+    """
+    Management command comparing write concurrency of the stock SQLite backend and library.backends.sqlite3.
+
+    For every profile the command migrates a throwaway file database, seeds it and lets a number of threads run
+    a mix of the library's write transactions for a fixed duration: a returned late book is recorded and charged
+    with Reader.update_balance (reading the penalties before writing), or a book is reserved with
+    Reservation.objects.reserve. It reports the committed transactions per second, the failed ones, the latency
+    of whole transactions and the lock wait, i.e. how long the statement taking the write lock ran: BEGIN
+    IMMEDIATE, or the first write of a deferred transaction or of an autocommit statement.
+
+    The stock profile uses django.db.backends.sqlite3 without PRAGMAs (rollback journal, the 5 s timeout of the
+    sqlite3 module); the library profile uses the project's backend with DEFAULT_SQLITE_PRAGMAS.
+
+    Example Usage:
+    python manage.py stress_db --threads 8 --duration 10
+    python manage.py stress_db --profile library --threads 16 --reserve-ratio 0.8
+
+    Note:
+        - The databases are created in a temporary directory; the configured database is not touched.
+        - A deferred transaction which reads before writing fails at once with "database is locked" when another
+          connection wrote in the meantime, so the stock profile is expected to report failures.
+    """
+    help = 'Compare write throughput and lock wait of the stock SQLite backend and the library profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help='Profile to run; can be repeated (default: all).')
+        parser.add_argument('--threads', type=int, default=8, help='Number of writing threads (default: 8).')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Duration of every profile in seconds (default: 10).')
+        parser.add_argument('--books', type=int, default=200, help='Number of books to seed (default: 200).')
+        parser.add_argument('--readers', type=int, default=50, help='Number of readers to seed (default: 50).')
+        parser.add_argument('--reserve-ratio', type=float, default=0.5,
+                            help='Share of reserve() transactions, the rest charge readers (default: 0.5).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['duration'] <= 0 or options['books'] < 1 or options['readers'] < 1:
+            raise CommandError('--threads, --duration, --books and --readers must be positive.')
+        if not 0 <= options['reserve_ratio'] <= 1:
+            raise CommandError('--reserve-ratio must be between 0 and 1.')
+        if connection.vendor != 'sqlite':
+            raise CommandError('stress_db compares SQLite configurations, the default database is not SQLite.')
+
+        results = {}
+        for name in options['profile'] or list(PROFILES):
+            self.stdout.write(f'Running {name} for {options["duration"]:g} s with {options["threads"]} threads...')
+            engine, pragmas = PROFILES[name]
+            with tempfile.TemporaryDirectory() as directory, \
+                    use_database(engine, Path(directory) / 'stress.sqlite3'), \
+                    override_settings(SQLITE_PRAGMAS=pragmas):
+                call_command('migrate', verbosity=0)
+                results[name] = StressTest(options).run()
+        self.print_results(results)
+
+    def print_results(self, results):
+        self.stdout.write(f'{"profile":<10}{"tx/s":>9}{"committed":>11}{"failed":>8}{"tx p50 ms":>11}'
+                          f'{"tx p95 ms":>11}{"wait p50 ms":>13}{"wait p95 ms":>13}{"wait p99 ms":>13}'
+                          f'{"wait max ms":>13}')
+        for name, result in results.items():
+            transactions = percentiles(result['latencies'])
+            waits = percentiles(result['lock_waits'])
+            self.stdout.write(f'{name:<10}{len(result["latencies"]) / result["elapsed"]:>9.1f}'
+                              f'{len(result["latencies"]):>11}{sum(result["errors"].values()):>8}'
+                              f'{transactions[49]:>11.2f}{transactions[94]:>11.2f}{waits[49]:>13.2f}'
+                              f'{waits[94]:>13.2f}{waits[98]:>13.2f}{max(result["lock_waits"], default=0):>13.2f}')
+        for name, result in results.items():
+            if result['errors']:
+                self.stdout.write(self.style.WARNING(f'{name} errors: {dict(result["errors"])}'))
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return [values[0] if values else 0] * 99
+    return statistics.quantiles(values, n=100, method='inclusive')
+
+
+@contextmanager
+def use_database(engine, name):
+    """
+    Point the default database to another SQLite file and backend for the duration of the block.
+
+    Connections are per thread and created from the settings on first use, so threads started inside the block
+    connect to the new database; the connection of the calling thread is closed on entry and on exit.
+    """
+    original = connections.settings['default']
+    connection.close()
+    del connections['default']
+    connections.settings['default'] = {**original, 'ENGINE': engine, 'NAME': name, 'CONN_MAX_AGE': 0}
+    try:
+        yield
+    finally:
+        connection.close()
+        del connections['default']
+        connections.settings['default'] = original
+
+
+class LockWaitRecorder:
+    """
+    Execute wrapper timing the statements which take the SQLite write lock on one connection.
+    """
+
+    def __init__(self, waits):
+        self.waits = waits
+        self.has_lock = False
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = sql.lstrip().upper()
+        in_transaction = context['connection'].in_atomic_block
+        if statement.startswith('BEGIN'):
+            takes_lock = self.has_lock = statement.startswith('BEGIN IMMEDIATE')
+        elif statement.startswith(WRITE_STATEMENTS):
+            takes_lock = not (in_transaction and self.has_lock)
+            self.has_lock = in_transaction
+        else:
+            takes_lock = False
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if takes_lock:
+                self.waits.append((time.perf_counter() - start) * 1000)
+
+
+class StressTest:
+    """
+    One stress run of the stress_db command against the current default database.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.latencies = []
+        self.lock_waits = []
+        self.errors = Counter()
+        self.lock = threading.Lock()
+
+    def run(self):
+        seeder = LibrarySeeder(self.rng)
+        seeder.seed_books(self.options['books'])
+        seeder.seed_readers(self.options['readers'], 'stress-password')
+        self.book_ids = list(seeder.book_ids)
+        self.reader_ids = list(seeder.reader_ids)
+        start = threading.Barrier(self.options['threads'] + 1)
+        threads = [threading.Thread(target=self.worker, args=(start, self.rng.random()))
+                   for _ in range(self.options['threads'])]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.monotonic()
+        self.deadline = started + self.options['duration']
+        for thread in threads:
+            thread.join()
+        return {'latencies': self.latencies, 'lock_waits': self.lock_waits, 'errors': self.errors,
+                'elapsed': time.monotonic() - started}
+
+    def worker(self, start, seed):
+        rng = random.Random(seed)
+        latencies, lock_waits, errors = [], [], Counter()
+        try:
+            with connection.execute_wrapper(LockWaitRecorder(lock_waits)):
+                start.wait()
+                while time.monotonic() < self.deadline:
+                    transaction_start = time.perf_counter()
+                    try:
+                        if rng.random() < self.options['reserve_ratio']:
+                            self.reserve(rng)
+                        else:
+                            self.charge(rng)
+                    except DatabaseError as error:
+                        errors[f'{type(error).__name__}: {error}'] += 1
+                    else:
+                        latencies.append((time.perf_counter() - transaction_start) * 1000)
+        finally:
+            connection.close()
+            with self.lock:
+                self.latencies.extend(latencies)
+                self.lock_waits.extend(lock_waits)
+                self.errors.update(errors)
+
+    def reserve(self, rng):
+        start_date = timezone.now().date() + timezone.timedelta(days=rng.randrange(60))
+        reservation = Reservation(book=Book(pk=rng.choice(self.book_ids)), reader_id=rng.choice(self.reader_ids),
+                                  start_date=start_date,
+                                  end_date=start_date + timezone.timedelta(days=rng.randrange(1, 8)))
+        Reservation.objects.reserve(reservation)
+
+    def charge(self, rng):
+        reader = Reader(pk=rng.choice(self.reader_ids), balance=0)
+        today = timezone.now().date()
+        CheckedOutBook.objects.create(reader=reader, book_id=rng.choice(self.book_ids),
+                                      start_date=today - timezone.timedelta(days=30),
+                                      due_date=today - timezone.timedelta(days=16),
+                                      end_date=today - timezone.timedelta(days=rng.randrange(1, 16)))
+        reader.update_balance()
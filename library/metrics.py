@@ -0,0 +1,73 @@
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+UNMATCHED_VIEW = '<unmatched>'
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_LATENCY = Histogram('library_request_duration_seconds', 'Time spent serving a request.',
+                            ['view', 'method'], buckets=LATENCY_BUCKETS)
+REQUEST_DB_TIME = Histogram('library_request_db_seconds', 'Time spent in database queries per request.',
+                            ['view'], buckets=DB_TIME_BUCKETS)
+RESPONSES = Counter('library_responses', 'Responses by status code.', ['view', 'method', 'status'])
+CACHE_REQUESTS = Counter('library_cache_requests', 'Cache lookups by cache and result (hit or miss).',
+                         ['cache', 'result'])
+
+# labels() takes the metric's lock on every call, so children are resolved once and kept in plain dicts,
+# whose reads and writes need no extra locking
+_children = {}
+
+
+def _child(metric, *labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+def record_request(view, method, status, duration, db_duration):
+    """
+    Record the latency, status code and database time of a served request.
+
+    :param view: (str) URL name of the view, e.g. 'book', or UNMATCHED_VIEW when no URL matched.
+    :param method: (str) HTTP method; unknown methods are recorded as 'other' to bound label cardinality.
+    :param status: (int) HTTP status code of the response.
+    :param duration: (float) Time spent serving the request in seconds.
+    :param db_duration: (float) Time spent in database queries in seconds.
+    """
+    method = method if method in KNOWN_METHODS else 'other'
+    _child(REQUEST_LATENCY, view, method).observe(duration)
+    _child(REQUEST_DB_TIME, view).observe(db_duration)
+    _child(RESPONSES, view, method, str(status)).inc()
+
+
+def record_cache(cache, hit):
+    """
+    Record a cache lookup; the hit ratio is computed from the hit and miss counters by the query.
+
+    :param cache: (str) Name of the cache, e.g. 'xslt'.
+    :param hit: (bool) Whether the lookup was a hit.
+    """
+    _child(CACHE_REQUESTS, cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text format.
+
+    When the PROMETHEUS_MULTIPROC_DIR environment variable is set, every worker process writes its values to
+    memory-mapped files in that directory and the returned metrics aggregate all workers, whichever worker
+    serves the scrape. Otherwise only the metrics of the current process are returned.
+
+    :return: Tuple (body, content_type).
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
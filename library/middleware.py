@@ -0,0 +1,231 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import UNMATCHED_VIEW, record_request
+
+logger = logging.getLogger('library.sql')
+
+DEFAULT_REPEATED_QUERY_THRESHOLD = 5
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """
+    Normalize an SQL statement so that statements differing only in their parameters compare equal.
+
+    :param sql: (str) SQL statement, with placeholders or inlined literals.
+    :return: The statement with literals and placeholders replaced by '?' and IN lists collapsed.
+    """
+    sql = sql.replace('%s', '?')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _PLACEHOLDER_LIST.sub('(?)', sql)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and their total duration.
+
+    Example Usage:
+    timer = QueryTimer()
+    with connection.execute_wrapper(timer):
+        do_queries()
+    print(timer.count, timer.duration)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryRecorder(QueryTimer):
+    """
+    QueryTimer which also counts how often each statement repeats.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements[sql] += 1
+        return super().__call__(execute, sql, params, many, context)
+
+    def repeated(self, threshold):
+        """
+        Return statements run at least threshold times, the usual sign of an N+1 query.
+
+        :param threshold: (int) Minimal number of executions of one statement fingerprint.
+        :return: List of (fingerprint, count) tuples, most repeated first.
+        """
+        fingerprints = Counter()
+        for sql, count in self.statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return [(sql, count) for sql, count in fingerprints.most_common() if count >= threshold]
+
+
+# execute wrappers active in the current context; a context variable instead of connection.execute_wrapper()
+# because async views run their queries in other threads (sync_to_async), which have their own connections but
+# inherit the context of the request
+_query_wrappers = ContextVar('library_query_wrappers', default=())
+
+
+def dispatch_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every database connection, passing queries through the wrappers active in the
+    current context (see wrap_connections).
+    """
+    for wrapper in reversed(_query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_dispatch(sender, connection, **kwargs):
+    """
+    Receiver of the connection_created signal installing dispatch_query on new database connections.
+    """
+    if dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch_query)
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    """
+    Pass all database queries of the current context through an execute wrapper, whichever thread and database
+    connection run them.
+
+    :param wrapper: (callable) Wrapper as accepted by connection.execute_wrapper().
+    """
+    token = _query_wrappers.set((*_query_wrappers.get(), wrapper))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Opt-in middleware reporting the SQL work done by every request.
+
+    For each request it counts queries and database time on all database connections, flags statements repeated
+    at least settings.SQL_REPEATED_QUERY_THRESHOLD times (N+1 candidates), adds a Server-Timing header shown by
+    browser developer tools, and logs one JSON line to the 'library.sql' logger, at WARNING level when repeated
+    statements were found.
+
+    The middleware is enabled by settings.SQL_INSTRUMENTATION. When it is off, the middleware removes itself
+    from the chain at startup, so it costs nothing per request. It supports both sync and async requests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SQL_REPEATED_QUERY_THRESHOLD', DEFAULT_REPEATED_QUERY_THRESHOLD)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with wrap_connections(recorder):
+            response = self.get_response(request)
+        return self.report(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with wrap_connections(recorder):
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, start)
+
+    def report(self, request, response, recorder, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+        repeated = recorder.repeated(self.threshold)
+
+        server_timing = f'db;desc="SQL ({recorder.count} queries)";dur={db_ms:.1f}, total;dur={total_ms:.1f}'
+        if response.has_header('Server-Timing'):
+            server_timing = f'{response["Server-Timing"]}, {server_timing}'
+        response['Server-Timing'] = server_timing
+
+        match = request.resolver_match
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(db_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'repeated': [{'sql': sql, 'count': count} for sql, count in repeated],
+        }))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Middleware recording the latency, status code and database time of every request in the Prometheus metrics
+    served by the metrics view, labelled with the URL name of the view.
+
+    The middleware is enabled by settings.METRICS_ENABLED. It should be the first middleware so that the recorded
+    latency covers the whole middleware chain. It supports both sync and async requests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with wrap_connections(timer):
+            response = self.get_response(request)
+        self.record(request, response, timer, start)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with wrap_connections(timer):
+            response = await self.get_response(request)
+        self.record(request, response, timer, start)
+        return response
+
+    @staticmethod
+    def record(request, response, timer, start):
+        match = request.resolver_match
+        record_request(match.view_name if match else UNMATCHED_VIEW, request.method, response.status_code,
+                       time.perf_counter() - start, timer.duration)
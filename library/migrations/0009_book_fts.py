@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from library.fts import install_book_fts, uninstall_book_fts
+
+
+def create_book_fts(apps, schema_editor):
+    install_book_fts(schema_editor)
+
+
+def drop_book_fts(apps, schema_editor):
+    uninstall_book_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_checkedoutbook_is_counted'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_book_fts, drop_book_fts),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'end_date', 'start_date'], name='reservation_book_dates_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+from library.fts import install_book_fts
+
+
+def reinstall_book_fts(apps, schema_editor):
+    # Altering a column rebuilds the library_book table on SQLite, which drops the triggers keeping the
+    # full-text index in sync.
+    install_book_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_reservation_book_dates_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, reinstall_book_fts),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(db_index=True, max_length=13),
+        ),
+        migrations.AddIndex(
+            model_name='checkedoutbook',
+            index=models.Index(fields=['reader', 'is_counted'], name='checkedout_reader_counted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkedoutbook',
+            index=models.Index(fields=['reader', 'end_date'], name='checkedout_reader_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['reader', 'start_date', 'end_date', 'is_active'], name='reservation_reader_dates_idx'),
+        ),
+        migrations.RunPython(reinstall_book_fts, migrations.RunPython.noop),
+    ]
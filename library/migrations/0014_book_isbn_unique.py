@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from library.fts import install_book_fts
+
+
+def check_unique_isbns(apps, schema_editor):
+    # Every copy of a book used to be its own row, so older databases can hold several books with one ISBN.
+    # They cannot be merged automatically, since each copy has its own availability, reservations and checkouts.
+    Book = apps.get_model('library', 'Book')
+    duplicates = (Book.objects.using(schema_editor.connection.alias).values('isbn')
+                  .annotate(copies=Count('pk')).filter(copies__gt=1).order_by('isbn')
+                  .values_list('isbn', 'copies'))
+    count = duplicates.count()
+    if count:
+        examples = ', '.join(f'{isbn} ({copies} books)' for isbn, copies in duplicates[:10])
+        raise RuntimeError(
+            f'Cannot make Book.isbn unique: {count} ISBN(s) are shared by several books, e.g. {examples}. '
+            f'Keep one book per ISBN (moving the reservations and checkouts of the other copies to it) or fix '
+            f'the wrong ISBNs, then run migrate again.')
+
+
+def reinstall_book_fts(apps, schema_editor):
+    # Altering a column rebuilds the library_book table on SQLite, which drops the triggers keeping the
+    # full-text index in sync.
+    install_book_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_unique_isbns, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, reinstall_book_fts),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(max_length=13, unique=True),
+        ),
+        migrations.RunPython(reinstall_book_fts, migrations.RunPython.noop),
+    ]
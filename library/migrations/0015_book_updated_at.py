@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-18 19:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from library.fts import install_book_fts
+
+
+def reinstall_book_fts(apps, schema_editor):
+    # Adding a NOT NULL column rebuilds the library_book table on SQLite, which drops the triggers keeping the
+    # full-text index in sync.
+    install_book_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_book_isbn_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, reinstall_book_fts),
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(reinstall_book_fts, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,16 @@
 from django.contrib.auth.base_user import BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, Exists, F, Func, IntegerField, OuterRef, Sum, Value, When
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from .autocomplete import autocomplete_index
+from .fragments import invalidate_books, invalidate_reader_snapshots, invalidate_readers
+
 
 class ReaderManager(BaseUserManager):
     """
@@ -98,13 +102,142 @@ class Reader(AbstractUser):
         super().save(*args, **kwargs)
 
     def update_balance(self):
-        late_books = CheckedOutBook.objects.all().filter(reader=self, is_counted=False)
-        total_penalty = Decimal(str(0))
-        for book in late_books:
-            total_penalty += Decimal(str(book.calculate_penalty()))
-        self.balance += total_penalty
-        late_books.update(is_counted=True)
-        self.save()
+        """
+        Charge the reader for returned books which have not been counted yet.
+
+        The penalty of all uncounted returned books is summed up in the database, then the books are marked as
+        counted and the sum is added to the balance with an F() expression, all inside one transaction.
+        The number of queries does not depend on the number of books. Books which have not been returned yet
+        stay uncounted, so their penalty is charged once they are returned. When there is nothing to count, a
+        single read query is run and no transaction is started; when all counted books were returned on time,
+        the reader row is not written.
+        """
+        late_books = CheckedOutBook.objects.filter(reader=self, is_counted=False, end_date__isnull=False)
+        if not late_books.exists():
+            return
+        with transaction.atomic():
+            total_penalty = late_books.aggregate(total=Sum(CheckedOutBook.objects.penalty_expression()))['total']
+            if total_penalty is None:
+                return
+            late_books.update(is_counted=True)
+            if not total_penalty:
+                return
+            Reader.objects.filter(pk=self.pk).update(balance=F('balance') + total_penalty)
+            invalidate_on_commit(invalidate_readers, [self.pk])
+            invalidate_on_commit(invalidate_reader_snapshots, [self.pk])
+        self.balance = (Decimal(str(self.balance)) + total_penalty).quantize(Decimal('0.01'))
+
+
+class ReservationQuerySet(models.QuerySet):
+    """
+    QuerySet for Reservation with set-based maintenance operations.
+
+    Methods:
+        - expire(batch_size=500): Deactivates past-due reservations and restores availability of their books.
+        - due_for_reminder(lead_days=1): Returns reservations starting soon whose reminder has not been sent yet.
+        - reserve(reservation): Saves a new reservation if its book is free in the reserved period.
+        - activate_started(): Activates reservations starting today and marks their books as unavailable.
+
+    Example Usage:
+    expired_count = Reservation.objects.expire()
+    """
+
+    def reserve(self, reservation):
+        """
+        Save a new reservation if its book is free in the reserved period.
+
+        The transaction starts by updating the book row, which takes its row lock (the write lock on SQLite), so
+        concurrent reservations of the same book run the overlap check and the insert one at a time and exactly one
+        of several overlapping reservations succeeds. The transaction is only a few statements long and no lock is
+        held while waiting for user input. A reservation starting today also marks the book as unavailable.
+
+        :param reservation: (Reservation) Unsaved reservation with its book, reader and dates set.
+        :return: True if the reservation was saved, False if it overlaps another reservation or a checkout.
+        """
+        book = reservation.book
+        with transaction.atomic():
+            Book.objects.filter(pk=book.pk).update(is_available=F('is_available'))
+            if not book.is_free_between(reservation.start_date, reservation.end_date):
+                return False
+            reservation.save()
+            if reservation.is_active:
+                Book.objects.filter(pk=book.pk).update(is_available=False, updated_at=timezone.now())
+                book.is_available = False
+        return True
+
+    def activate_started(self):
+        """
+        Activate reservations in this queryset which have started and mark their books as unavailable.
+
+        Reservations made for a future date do not lock their book until they start; this method (run daily
+        by the expire_reservations command) makes them active on their start date with two set-based UPDATEs.
+        Cached fragments of the books which became unavailable and of the readers are invalidated.
+
+        :return: activated_count (int): The number of reservations activated.
+        """
+        today = timezone.now().date()
+        started = self.filter(is_active=False, start_date__lte=today, end_date__gte=today)
+        with transaction.atomic():
+            book_ids = list(Book.objects.filter(
+                Exists(started.filter(book=OuterRef('pk'))),
+                is_available=True,
+            ).values_list('pk', flat=True))
+            reader_ids = set(started.values_list('reader_id', flat=True))
+            Book.objects.filter(pk__in=book_ids).update(is_available=False, updated_at=timezone.now())
+            activated_count = started.update(is_active=True)
+            invalidate_on_commit(invalidate_books, book_ids)
+            invalidate_on_commit(invalidate_readers, reader_ids)
+        return activated_count
+
+    def due_for_reminder(self, lead_days=1):
+        """
+        Return reservations whose reader asked for a reminder which has not been sent yet,
+        starting between today and lead_days days from now.
+
+        The filter matches the partial reservation_reminder_due_idx index, so it stays cheap however many
+        reservations have already been reminded.
+
+        :param lead_days: (int) How many days before the start date the reminder is sent.
+        :return: QuerySet of due reservations.
+        """
+        today = timezone.now().date()
+        return self.filter(should_remind=True, reminder_sent_at__isnull=True,
+                           start_date__gte=today, start_date__lte=today + timezone.timedelta(days=lead_days))
+
+    def expire(self, batch_size=500):
+        """
+        End all active reservations in this queryset whose end date is in the past.
+
+        Reservations are processed in chunks, each in its own short transaction made of three statements: select
+        the ids of a chunk, deactivate it, and mark its books as available unless they are still reserved by
+        another active reservation or checked out. Short transactions keep the SQLite write lock free for live
+        traffic between chunks, and running the method again is a no-op. Cached fragments of the books and readers
+        of ended reservations are invalidated.
+
+        :param batch_size: (int) Number of reservations ended per transaction.
+        :return: expired_count (int): The number of reservations ended.
+        """
+        past_due = self.filter(is_active=True, end_date__lt=timezone.now().date()).order_by('pk')
+        expired_count = 0
+        while True:
+            with transaction.atomic():
+                rows = list(past_due.values_list('pk', 'book_id', 'reader_id')[:batch_size])
+                if not rows:
+                    break
+                book_ids = {book_id for _, book_id, _ in rows}
+                Reservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(is_active=False)
+                Book.objects.filter(
+                    pk__in=book_ids,
+                    is_available=False,
+                ).exclude(
+                    Exists(Reservation.objects.filter(book=OuterRef('pk'), is_active=True))
+                ).exclude(
+                    Exists(CheckedOutBook.objects.filter(book=OuterRef('pk'), end_date__isnull=True))
+                ).update(is_available=True, updated_at=timezone.now())
+                invalidate_on_commit(invalidate_books, book_ids)
+                invalidate_on_commit(invalidate_readers, {reader_id for _, _, reader_id in rows})
+            expired_count += len(rows)
+        return expired_count
 
 
 class Reservation(models.Model):
@@ -119,13 +252,18 @@ class Reservation(models.Model):
         - is_active (BooleanField): Field indicating whether the reservation is currently active.
         - should_remind (BooleanField): Field indicating whether a reminder should be sent for the reservation.
         - add_info (TextField): Field for additional information related to the reservation (optional).
+        - reminder_sent_at (DateTimeField): Field representing when the reminder was sent (empty until then).
 
     Methods:
         - end_reservation(): Method to end the reservation, updating related fields and saving changes.
 
+    Manager:
+        - objects (ReservationQuerySet): Manager which can also expire reservations in bulk.
+
     Example Usage:
     reservation = Reservation.objects.get(pk=1)
     reservation.end_reservation()  # Ending an active reservation.
+    Reservation.objects.expire()  # Ending all past-due reservations at once.
 
     Note:
         - The end_reservation method checks if the reservation end date is in the past and updates relevant fields.
@@ -138,6 +276,18 @@ class Reservation(models.Model):
     is_active = models.BooleanField(default=False)
     should_remind = models.BooleanField(default=True)
     add_info = models.TextField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_date'], name='reservation_reminder_due_idx',
+                         condition=models.Q(should_remind=True, reminder_sent_at__isnull=True)),
+            models.Index(fields=['book', 'end_date', 'start_date'], name='reservation_book_dates_idx'),
+            models.Index(fields=['reader', 'start_date', 'end_date', 'is_active'],
+                         name='reservation_reader_dates_idx'),
+        ]
 
     def end_reservation(self):
         """
@@ -153,6 +303,61 @@ class Reservation(models.Model):
             self.book.save()
 
 
+class DaysBetween(Func):
+    """
+    Number of days from the first date expression to the second one, computed by the database.
+
+    Example Usage:
+    CheckedOutBook.objects.annotate(days=DaysBetween('due_date', 'end_date'))
+    """
+    arity = 2
+    output_field = IntegerField()
+
+    def as_sql(self, compiler, connection, template='(%s - %s)', **extra_context):
+        start, end = self.source_expressions
+        end_sql, end_params = compiler.compile(end)
+        start_sql, start_params = compiler.compile(start)
+        return template % (end_sql, start_sql), (*end_params, *start_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%s) - julianday(%s) AS INTEGER)')
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%s, %s)')
+
+
+class CheckedOutBookQuerySet(models.QuerySet):
+    """
+    QuerySet for CheckedOutBook which can compute penalty fees in the database.
+
+    Methods:
+        - penalty_expression(): Returns the expression computing the penalty of a checked-out book.
+        - with_penalty(): Annotates every checked-out book with its penalty.
+
+    Example Usage:
+    for checked_out_book in CheckedOutBook.objects.filter(reader=reader).with_penalty():
+        print(checked_out_book.penalty)
+    """
+
+    @staticmethod
+    def penalty_expression():
+        """
+        Database counterpart of CheckedOutBook.calculate_penalty.
+
+        :return: Expression evaluating to the (negative) penalty fee as a decimal, 0.00 for books returned on time
+            or not returned yet.
+        """
+        return Case(
+            When(end_date__gt=F('due_date'),
+                 then=DaysBetween('due_date', 'end_date') * Value(-CheckedOutBook.PENALTY_PER_DAY)),
+            default=Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+
+    def with_penalty(self):
+        return self.annotate(penalty=self.penalty_expression())
+
+
 class CheckedOutBook(models.Model):
     """
     Model representing a book checked out by a reader in the system.
@@ -167,9 +372,13 @@ class CheckedOutBook(models.Model):
     Methods:
         - calculate_penalty(): Method to calculate a penalty fee based on the delay in returning the book.
 
+    Manager:
+        - objects (CheckedOutBookQuerySet): Manager which can also annotate penalties computed by the database.
+
     Example Usage:
     checked_out_book = CheckedOutBook.objects.get(pk=1)
     penalty_fee = checked_out_book.calculate_penalty()  # Calculating penalty if the book is returned late.
+    penalties = CheckedOutBook.objects.with_penalty()  # Calculating penalties in the database.
 
     Note:
         - The calculate_penalty method determines if the book was returned late and calculates a penalty fee.
@@ -183,6 +392,16 @@ class CheckedOutBook(models.Model):
     is_penalty_paid = models.BooleanField(default=False)
     is_counted = models.BooleanField(default=False)
 
+    PENALTY_PER_DAY = Decimal('2.00')
+
+    objects = CheckedOutBookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reader', 'is_counted'], name='checkedout_reader_counted_idx'),
+            models.Index(fields=['reader', 'end_date'], name='checkedout_reader_end_idx'),
+        ]
+
     def calculate_penalty(self):
         """
         Calculate a penalty fee based on the delay in returning the book.
@@ -203,11 +422,182 @@ class CheckedOutBook(models.Model):
 class Book(models.Model):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255)
-    isbn = models.CharField(max_length=13)
+    isbn = models.CharField(max_length=13, unique=True)
     publisher = models.CharField(max_length=255)
     pub_year = models.IntegerField()
     image_url = models.URLField()
     is_available = models.BooleanField(default=True)
+    # also set by the bulk availability updates, which bypass auto_now
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
+
+    def is_free_between(self, start_date, end_date):
+        """
+        Check whether the book can be reserved from start_date to end_date (both inclusive).
+
+        The book is not free if the period overlaps one of its reservations or an open checkout. Overdue open
+        checkouts block every period, since the return date is unknown. The check is a single query using the
+        reservation_book_dates_idx index, which only visits reservations ending on or after start_date.
+
+        :param start_date: (date) First day of the period.
+        :param end_date: (date) Last day of the period.
+        :return: True if nothing blocks the book in the period.
+        """
+        overlapping_reservations = Reservation.objects.filter(book=OuterRef('pk'),
+                                                              end_date__gte=start_date,
+                                                              start_date__lte=end_date)
+        open_checkouts = CheckedOutBook.objects.filter(
+            models.Q(due_date__gte=start_date) | models.Q(due_date__lt=timezone.now().date()),
+            book=OuterRef('pk'),
+            end_date__isnull=True,
+            start_date__lte=end_date,
+        )
+        return not Book.objects.filter(Exists(overlapping_reservations) | Exists(open_checkouts),
+                                       pk=self.pk).exists()
+
+    def next_free_window(self, days, from_date=None):
+        """
+        Find the first date from which the book can be reserved for the given number of days.
+
+        Periods are checked with the same rules as is_free_between, so the date found is accepted by it.
+
+        :param days: (int) Length of the reservation in days, as in ReservationForm.how_long.
+        :param from_date: (date) Earliest acceptable start date, today by default.
+        :return: next_free_date (date): First start date of a free period of that length, or None if an overdue
+                 open checkout blocks the book, since its return date is unknown.
+        """
+        today = timezone.now().date()
+        from_date = from_date or today
+        open_checkouts = list(CheckedOutBook.objects.filter(book=self, end_date__isnull=True)
+                              .values_list('start_date', 'due_date'))
+        if any(due_date < today for start_date, due_date in open_checkouts):
+            return None
+        busy = list(Reservation.objects.filter(book=self, end_date__gte=from_date)
+                    .values_list('start_date', 'end_date'))
+        busy += open_checkouts
+        next_free_date = from_date
+        for start_date, end_date in sorted(busy):
+            if next_free_date + timezone.timedelta(days=days) < start_date:
+                break
+            next_free_date = max(next_free_date, end_date + timezone.timedelta(days=1))
+        return next_free_date
+
+
+class OutboxEmailManager(models.Manager):
+    """
+    Manager for OutboxEmail used by views to queue emails instead of sending them.
+
+    Methods:
+        - enqueue(subject, body, to, from_email=None, html_body='', content_subtype='plain'):
+          Stores an email to be sent by the send_outbox command.
+    """
+
+    def enqueue(self, subject, body, to, from_email=None, html_body='', content_subtype='plain'):
+        return self.create(subject=subject, body=body, recipients='\n'.join(to),
+                           from_email=from_email or '', html_body=html_body or '',
+                           content_subtype=content_subtype)
+
+
+class OutboxEmail(models.Model):
+    """
+    Model representing an email waiting in the outbox to be sent by the send_outbox command.
+
+    Attributes:
+        - subject (CharField): Subject of the email.
+        - body (TextField): Body of the email.
+        - html_body (TextField): Optional HTML alternative of the body.
+        - content_subtype (CharField): Subtype of the body, 'plain' or 'html'.
+        - from_email (CharField): Sender address, empty for settings.DEFAULT_FROM_EMAIL.
+        - recipients (TextField): Recipient addresses, one per line.
+        - status (CharField): Field indicating whether the email is pending, sent or failed for good.
+        - attempts (PositiveSmallIntegerField): Number of failed delivery attempts so far.
+        - next_attempt_at (DateTimeField): Earliest time of the next delivery attempt.
+        - last_error (TextField): Error raised by the last failed delivery attempt.
+        - created_at (DateTimeField): Time when the email was queued.
+        - sent_at (DateTimeField): Time when the email was sent.
+
+    Manager:
+        - objects (OutboxEmailManager): Manager providing enqueue().
+
+    Example Usage:
+    OutboxEmail.objects.enqueue('Subject', 'Body', ['reader@example.com'])
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    content_subtype = models.CharField(max_length=20, default='plain')
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEmailManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='outbox_pending_idx',
+                         condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return self.subject
+
+
+def invalidate_on_commit(invalidate, pks):
+    """
+    Invalidate cached fragments right away and again once the current transaction commits.
+
+    The second invalidation drops fragments which concurrent requests rendered from the old rows while the
+    transaction was still open. Outside a transaction both happen immediately.
+
+    :param invalidate: (callable) invalidate_books, invalidate_readers or invalidate_reader_snapshots.
+    :param pks: (iterable) Primary keys of the changed books or readers.
+    """
+    pks = list(pks)
+    invalidate(pks)
+    transaction.on_commit(lambda: invalidate(pks))
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book_fragments(sender, instance, **kwargs):
+    invalidate_on_commit(invalidate_books, [instance.pk])
+
+
+@receiver(post_save, sender=Book)
+def update_autocomplete_index(sender, instance, **kwargs):
+    book_id, title, author = instance.pk, instance.title, instance.author
+    transaction.on_commit(lambda: autocomplete_index.update(book_id, title, author))
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove(book_id))
+
+
+@receiver([post_save, post_delete], sender=Reader)
+def invalidate_reader_fragments(sender, instance, **kwargs):
+    invalidate_on_commit(invalidate_readers, [instance.pk])
+    invalidate_on_commit(invalidate_reader_snapshots, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Reservation)
+@receiver([post_save, post_delete], sender=CheckedOutBook)
+def invalidate_booking_fragments(sender, instance, **kwargs):
+    invalidate_on_commit(invalidate_books, [instance.book_id])
+    invalidate_on_commit(invalidate_readers, [instance.reader_id])
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 5
+DEFAULT_OUTBOX_RETRY_DELAY = 60
+DEFAULT_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+OUTBOX_LEASE = timezone.timedelta(minutes=10)
+
+
+def retry_delay(attempts):
+    """
+    Compute the exponential backoff before the next delivery attempt.
+
+    :param attempts: (int) Number of failed attempts so far.
+    :return: Delay as a timedelta, doubling with every attempt up to settings.OUTBOX_MAX_RETRY_DELAY seconds.
+    """
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', DEFAULT_OUTBOX_RETRY_DELAY)
+    cap = getattr(settings, 'OUTBOX_MAX_RETRY_DELAY', DEFAULT_OUTBOX_MAX_RETRY_DELAY)
+    return timezone.timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def build_message(outbox_email, connection=None):
+    message = EmailMultiAlternatives(outbox_email.subject, outbox_email.body,
+                                     from_email=outbox_email.from_email or None,
+                                     to=outbox_email.recipients.split('\n'),
+                                     connection=connection)
+    message.content_subtype = outbox_email.content_subtype
+    if outbox_email.html_body:
+        message.attach_alternative(outbox_email.html_body, 'text/html')
+    return message
+
+
+def claim_batch(batch_size):
+    """
+    Lease a batch of due pending emails to the calling worker.
+
+    The batch is leased by moving its next_attempt_at into the future, so other workers skip it and, should this
+    worker crash, the emails become due again once the lease expires.
+
+    :param batch_size: (int) Maximum number of emails to claim.
+    :return: List of claimed OutboxEmail objects.
+    """
+    now = timezone.now()
+    due_pks = list(OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                   .order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+    if not due_pks:
+        return []
+    lease_until = now + OUTBOX_LEASE
+    OutboxEmail.objects.filter(pk__in=due_pks, status=OutboxEmail.PENDING,
+                               next_attempt_at__lte=now).update(next_attempt_at=lease_until)
+    return list(OutboxEmail.objects.filter(pk__in=due_pks, next_attempt_at=lease_until))
+
+
+def close_connection(connection):
+    """
+    Close a mail connection, ignoring errors, as a connection closed after a failure may already be broken.
+
+    :param connection: Mail backend instance or None.
+    """
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def send_outbox_batch(batch_size=100, max_attempts=None, backend=None):
+    """
+    Send one batch of due emails from the outbox over a single mail connection.
+
+    Every email is marked as sent as soon as the backend accepted it, so an error later in the batch cannot
+    make it go out again once the lease expires. Failed ones are rescheduled with exponential backoff and marked
+    as failed for good after max_attempts attempts, with the error kept in last_error.
+
+    :param batch_size: (int) Maximum number of emails sent.
+    :param max_attempts: (int) Delivery attempts before giving up, defaults to settings.OUTBOX_MAX_ATTEMPTS.
+    :param backend: (str) Dotted path of the mail backend, defaults to settings.EMAIL_BACKEND.
+    :return: Tuple (sent_count, failed_count), both 0 when the outbox is empty.
+    """
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', DEFAULT_OUTBOX_MAX_ATTEMPTS)
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent_count = 0
+    failed = []
+    connection = None
+    try:
+        for outbox_email in batch:
+            try:
+                if connection is None:
+                    connection = get_connection(backend)
+                    connection.open()
+                connection.send_messages([build_message(outbox_email)])
+            except Exception as error:
+                failed.append((outbox_email, error))
+                # The connection may be broken, open a fresh one for the next message.
+                close_connection(connection)
+                connection = None
+            else:
+                OutboxEmail.objects.filter(pk=outbox_email.pk).update(status=OutboxEmail.SENT,
+                                                                      sent_at=timezone.now())
+                sent_count += 1
+    finally:
+        close_connection(connection)
+
+    now = timezone.now()
+    for outbox_email, error in failed:
+        outbox_email.attempts += 1
+        outbox_email.last_error = repr(error)
+        if outbox_email.attempts >= max_attempts:
+            outbox_email.status = OutboxEmail.FAILED
+        else:
+            outbox_email.next_attempt_at = now + retry_delay(outbox_email.attempts)
+        outbox_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return sent_count, len(failed)
@@ -0,0 +1,169 @@
+import queue
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Reservation
+
+REMINDER_SUBJECT = 'Reservation reminder'
+DEFAULT_REMINDER_LEAD_DAYS = 1
+
+
+class ReminderDispatcher:
+    """
+    Sends reminder emails for upcoming reservations.
+
+    Due reservations are read in batches with one indexed query per batch. Each batch is claimed by setting
+    reminder_sent_at before it is handed to a pool of worker threads, so reruns (or a crash halfway through) never
+    send the same reminder twice. The batch is read and claimed in one transaction which locks its rows (on SQLite
+    the whole database, see library.backends.sqlite3), and only rows which were still unclaimed are sent, so runs
+    started at the same time never send a reminder twice either. Every worker opens a single mail connection and
+    reuses it for all the batches it sends. Reminders which fail to send are released again so the next run
+    retries them.
+
+    Attributes:
+        - batch_size (int): Number of reminders rendered, claimed and sent together.
+        - workers (int): Number of sending threads, each holding one mail connection.
+        - lead_days (int): How many days before the start of a reservation its reminder is sent.
+
+    Methods:
+        - run(): Sends all due reminders and returns a (sent_count, failed_count) tuple.
+
+    Example Usage:
+    sent_count, failed_count = ReminderDispatcher(batch_size=200, workers=4).run()
+
+    Note:
+        - Database access happens only in the calling thread; worker threads just talk to the mail server.
+        - The mail backend is taken from settings.EMAIL_BACKEND unless a backend path is given, so the dispatcher
+          can be exercised offline with the locmem or file backends.
+    """
+
+    def __init__(self, batch_size=100, workers=4, lead_days=None, backend=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        if lead_days is None:
+            lead_days = getattr(settings, 'RESERVATION_REMINDER_LEAD_DAYS', DEFAULT_REMINDER_LEAD_DAYS)
+        self.lead_days = lead_days
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._sent_count = 0
+        self._failed_pks = []
+
+    def run(self):
+        batches = queue.Queue(maxsize=self.workers * 2)
+        threads = [threading.Thread(target=self._work, args=(batches,), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for batch in self._claimed_batches():
+                batches.put(batch)
+        finally:
+            for _ in threads:
+                batches.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self._failed_pks:
+            Reservation.objects.filter(pk__in=self._failed_pks).update(reminder_sent_at=None)
+        return self._sent_count, len(self._failed_pks)
+
+    def _claimed_batches(self):
+        due = (Reservation.objects.due_for_reminder(self.lead_days).select_related('reader', 'book')
+               .select_for_update(skip_locked=True, of=('self',)).order_by('pk'))
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                reservations = list(due.filter(pk__gt=last_pk)[:self.batch_size])
+                if not reservations:
+                    return
+                last_pk = reservations[-1].pk
+                reservations = self._claim(reservations)
+            if reservations:
+                yield [(reservation.pk, self._render(reservation)) for reservation in reservations]
+
+    @staticmethod
+    def _claim(reservations):
+        """
+        Set reminder_sent_at of the reservations which are still unclaimed.
+
+        :param reservations: (list) Reservations read in the current transaction.
+        :return: List of the reservations claimed by this call.
+        """
+        claimed_at = timezone.now()
+        pks = [reservation.pk for reservation in reservations]
+        claimed_count = Reservation.objects.filter(pk__in=pks, reminder_sent_at__isnull=True).update(
+            reminder_sent_at=claimed_at)
+        if claimed_count == len(reservations):
+            return reservations
+        # another run claimed some of them after they were read, which the row locks normally prevent
+        claimed_pks = set(Reservation.objects.filter(pk__in=pks, reminder_sent_at=claimed_at)
+                          .values_list('pk', flat=True))
+        return [reservation for reservation in reservations if reservation.pk in claimed_pks]
+
+    def _render(self, reservation):
+        message = render_to_string('reminders/reservation_reminder_message.html', {
+            'reservation': reservation,
+            'user': reservation.reader,
+            'book': reservation.book,
+        })
+        email = EmailMessage(REMINDER_SUBJECT, message, to=[reservation.reader.email])
+        email.content_subtype = 'html'
+        return email
+
+    def _work(self, batches):
+        connection = None
+        batch = batches.get()
+        try:
+            while batch is not None:
+                sent_count, failed_pks = 0, []
+                for pk, message in batch:
+                    try:
+                        if connection is None:
+                            connection = get_connection(self.backend)
+                            connection.open()
+                        sent_count += connection.send_messages([message]) or 0
+                    except Exception:
+                        failed_pks.append(pk)
+                        # The connection may be broken, open a fresh one for the next message.
+                        self._close(connection)
+                        connection = None
+                with self._lock:
+                    self._sent_count += sent_count
+                    self._failed_pks.extend(failed_pks)
+                batch = batches.get()
+        except BaseException:
+            # Keep taking batches until the end, so run() never blocks on a full queue; the reminders of the
+            # current and the remaining batches are released for the next run.
+            while batch is not None:
+                with self._lock:
+                    self._failed_pks.extend(pk for pk, message in batch)
+                batch = batches.get()
+            raise
+        finally:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def send_reservation_reminders(batch_size=100, workers=4, lead_days=None, backend=None):
+    """
+    Send all due reservation reminders.
+
+    :param batch_size: (int) Number of reminders sent together over one connection.
+    :param workers: (int) Number of sending threads.
+    :param lead_days: (int) How many days before the start date reminders are sent,
+        defaults to settings.RESERVATION_REMINDER_LEAD_DAYS.
+    :param backend: (str) Dotted path of the mail backend, defaults to settings.EMAIL_BACKEND.
+    :return: Tuple (sent_count, failed_count).
+    """
+    return ReminderDispatcher(batch_size=batch_size, workers=workers, lead_days=lead_days, backend=backend).run()
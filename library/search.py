@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+
+from .fts import BOOK_FTS_TABLE, BOOK_FTS_WEIGHTS, book_fts_enabled, build_match_query
+from .models import Book
+
+DEFAULT_SEARCH_PAGE_SIZE = 20
+CURSOR_SALT = 'library.search.cursor'
+
+
+class SearchPage:
+    """
+    One page of book search results.
+
+    Pages are addressed with keyset cursors instead of offsets: a cursor holds the sort key of the first or last
+    book shown and the direction to move in, so fetching any page is a single bounded query which neither skips
+    over earlier results nor counts the whole match set.
+
+    Attributes:
+        - books (list): Books on this page, in result order.
+        - next_cursor (str): Opaque cursor of the following page, or None on the last page.
+        - prev_cursor (str): Opaque cursor of the preceding page, or None on the first page.
+
+    Example Usage:
+    page = search_books('tolkien', cursor=request.GET.get('cursor'))
+    for book in page.books:
+        print(book.title)
+    """
+
+    def __init__(self, books, next_cursor=None, prev_cursor=None):
+        self.books = books
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __bool__(self):
+        return bool(self.books)
+
+
+def encode_cursor(direction, key):
+    return signing.dumps({'d': direction, 'k': list(key)}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    :param cursor: (str) Opaque cursor taken from the request, may be empty.
+    :return: Tuple (direction, key), or (None, None) for a missing, malformed or tampered cursor.
+    """
+    if not cursor:
+        return None, None
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+        direction, key = data['d'], tuple(data['k'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None, None
+    if direction not in ('next', 'prev'):
+        return None, None
+    return direction, key
+
+
+def search_books(query, cursor=None, page_size=None, fields=None):
+    """
+    Find one page of books matching a search query.
+
+    When the full-text index is available, books are matched by word prefixes in their title, author, publisher
+    and ISBN and ordered by BM25 relevance, ties broken by id. On backends without FTS5 the query falls back to
+    case-insensitive substring matching on title, author and ISBN, ordered by id.
+
+    :param query: (str) Search query entered by the user.
+    :param cursor: (str) Cursor of the requested page, as exposed by SearchPage; None for the first page.
+    :param page_size: (int) Maximum number of books on the page, defaults to settings.SEARCH_RESULTS_PAGE_SIZE.
+    :param fields: (iterable) If given, books are loaded with .values() as dictionaries of these fields and 'id'
+                   instead of model instances.
+    :return: SearchPage with the matching books.
+    """
+    if page_size is None:
+        page_size = getattr(settings, 'SEARCH_RESULTS_PAGE_SIZE', DEFAULT_SEARCH_PAGE_SIZE)
+    direction, after = decode_cursor(cursor)
+    fts_enabled = book_fts_enabled()
+    if after is not None and len(after) != (2 if fts_enabled else 1):
+        # a cursor of the other search method, e.g. issued before the full-text index was installed
+        direction, after = None, None
+
+    if fts_enabled:
+        rows = _fts_keyset(query, direction, after, page_size + 1)
+    else:
+        rows = _orm_keyset(query, direction, after, page_size + 1)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'prev':
+        rows.reverse()
+    if not rows:
+        return SearchPage([])
+
+    book_ids = [row[-1] for row in rows]
+    if fields is None:
+        books = Book.objects.in_bulk(book_ids)
+    else:
+        values = Book.objects.filter(pk__in=book_ids).values(*dict.fromkeys(('id', *fields)))
+        books = {book['id']: book for book in values}
+    page = SearchPage([books[row[-1]] for row in rows if row[-1] in books])
+    if direction == 'prev':
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, direction == 'next'
+    if has_next:
+        page.next_cursor = encode_cursor('next', rows[-1])
+    if has_prev:
+        page.prev_cursor = encode_cursor('prev', rows[0])
+    return page
+
+
+def _fts_keyset(query, direction, after, limit):
+    """
+    Fetch sort keys of matching books from the full-text index.
+
+    :return: List of (rank, id) tuples in the order of travel.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for weight in BOOK_FTS_WEIGHTS)
+    sql = (f"SELECT rank, id FROM (SELECT bm25({BOOK_FTS_TABLE}, {weights}) AS rank, rowid AS id "
+           f"FROM {BOOK_FTS_TABLE} WHERE {BOOK_FTS_TABLE} MATCH %s)")
+    params = [match]
+    if after:
+        sql += " WHERE (rank, id) < (%s, %s)" if direction == 'prev' else " WHERE (rank, id) > (%s, %s)"
+        params += list(after)
+    sql += " ORDER BY rank DESC, id DESC" if direction == 'prev' else " ORDER BY rank, id"
+    sql += " LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def _orm_keyset(query, direction, after, limit):
+    """
+    Fetch sort keys of matching books with the ORM substring filter.
+
+    :return: List of (id,) tuples in the order of travel.
+    """
+    books = Book.objects.filter(
+        Q(title__icontains=query) |
+        Q(author__icontains=query) |
+        Q(isbn__icontains=query)
+    )
+    if after:
+        books = books.filter(id__lt=after[0]) if direction == 'prev' else books.filter(id__gt=after[0])
+    books = books.order_by('-id' if direction == 'prev' else 'id')
+    return [(book_id,) for book_id in books.values_list('id', flat=True)[:limit]]
@@ -0,0 +1,188 @@
+import time
+from array import array
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Exists, IntegerField, Max, OuterRef
+from django.db.models.functions import Cast, Length, Substr
+from django.utils import timezone
+
+from .fts import book_fts_enabled, install_book_fts, uninstall_book_fts
+from .models import Book, CheckedOutBook, Reader, Reservation
+
+WORDS = ['dune', 'empire', 'garden', 'history', 'island', 'journey', 'kingdom', 'letters', 'mountain', 'night',
+         'ocean', 'river', 'shadow', 'silence', 'winter', 'world', 'stone', 'glass', 'fire', 'city', 'secret',
+         'summer', 'storm', 'forest', 'house', 'light', 'road', 'song', 'star', 'time']
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Ewa', 'Frank', 'Greta', 'Hugo', 'Ida', 'Jan', 'Kasia', 'Leo']
+LAST_NAMES = ['Nowak', 'Smith', 'Kowalski', 'Brown', 'Wilson', 'Taylor', 'Lewandowski', 'Clark', 'Walker']
+PUBLISHERS = ['Penguin', 'HarperCollins', 'Macmillan', 'Hachette', 'Simon & Schuster', 'Znak', 'Ace']
+
+
+class LibrarySeeder:
+    """
+    Generates large, deterministic library datasets.
+
+    Rows are produced lazily and written with bulk_create in chunks, each chunk in its own transaction, so memory
+    use does not grow with the number of rows. The only per-row state kept is the primary keys of created books
+    and readers, stored in compact arrays, and the activity of every reader. All readers share one precomputed
+    password hash. ISBNs and emails continue after the highest existing ones, so seeding can be repeated on a
+    database which already holds books and readers.
+
+    Attributes:
+        - rng (random.Random): Source of randomness; the same seed always produces the same data.
+        - batch_size (int): Number of rows per bulk_create and transaction.
+        - progress (callable): Called with a message after every chunk, e.g. self.stdout.write.
+
+    Methods:
+        - seed_books(count): Creates books.
+        - seed_readers(count, password): Creates readers who can log in with the given password.
+        - seed_history(per_reader, late_ratio, days, skew): Creates past and current reservations and checkouts.
+
+    Example Usage:
+    seeder = LibrarySeeder(random.Random(42))
+    seeder.seed_books(1_000_000)
+    seeder.seed_readers(100_000, 'password')
+    seeder.seed_history(per_reader=10)
+    """
+
+    def __init__(self, rng, batch_size=5000, progress=None):
+        self.rng = rng
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.book_ids = array('q')
+        self.reader_ids = array('q')
+        self.current_year = timezone.now().year
+
+    def seed_books(self, count):
+        last_isbn = Book.objects.filter(isbn__regex=r'^978[0-9]{10}$').aggregate(last=Max('isbn'))['last']
+        first_isbn = int(last_isbn) + 1 if last_isbn else 9780000000000
+        books = (self._book(first_isbn + i) for i in range(count))
+        # Maintaining the full-text index row by row is much slower than rebuilding it once at the end.
+        fts_enabled = book_fts_enabled()
+        if fts_enabled:
+            with connection.schema_editor() as schema_editor:
+                uninstall_book_fts(schema_editor)
+        try:
+            self._bulk_create('books', books, count, self.book_ids)
+        finally:
+            if fts_enabled:
+                with connection.schema_editor() as schema_editor:
+                    install_book_fts(schema_editor)
+
+    def seed_readers(self, count, password):
+        password_hash = make_password(password)
+        numbered = Reader.objects.filter(email__regex=r'^reader[0-9]+@example\.com$').annotate(
+            number=Cast(Substr('email', 7, Length('email') - 18), IntegerField()))
+        last_number = numbered.aggregate(last=Max('number'))['last']
+        offset = last_number + 1 if last_number is not None else 0
+        readers = (self._reader(offset + i, password_hash) for i in range(count))
+        self._bulk_create('readers', readers, count, self.reader_ids)
+
+    def seed_history(self, per_reader=10, late_ratio=0.2, days=730, skew=2.0):
+        """
+        Create reservations and checkouts for the seeded books and readers.
+
+        Every book gets a timeline from `days` days ago to a week from now, split into equal segments which hold
+        one reservation or checkout each, so the entries of a book never overlap. The number of entries of a book
+        follows a popularity skew: with skew 1 every book is equally popular, higher values favour a small set of
+        popular titles; a book gets at most one entry per six days. Readers are picked in proportion to their
+        activity, which is exponentially distributed around per_reader. A checkout which would end after today is
+        still open, and the timeline of its book ends with it. Books with an active reservation or an open
+        checkout are marked as unavailable at the end.
+
+        :param per_reader: (float) Mean number of reservations (and checkouts) per reader.
+        :param late_ratio: (float) Fraction of checkouts returned after their due date.
+        :param days: (int) Length of the generated history in days, ending today.
+        :param skew: (float) Popularity skew of books.
+        """
+        if not self.book_ids or not self.reader_ids or not per_reader:
+            return
+        activity = [min(self.rng.expovariate(1 / per_reader), per_reader * 10) for _ in range(len(self.reader_ids))]
+        cum_activity = list(accumulate(activity))
+        total = int(2 * cum_activity[-1])
+        today = timezone.now().date()
+        self._bulk_create('reservations and checkouts', self._history(cum_activity, today, days, skew, late_ratio),
+                          total)
+        self._mark_unavailable()
+
+    def _book(self, isbn):
+        rng = self.rng
+        return Book(title=' '.join(rng.sample(WORDS, rng.randint(1, 4))).capitalize(),
+                    author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    isbn=str(isbn), publisher=rng.choice(PUBLISHERS), pub_year=rng.randint(1850, self.current_year),
+                    image_url=f'https://example.com/covers/{isbn}.jpg')
+
+    def _reader(self, number, password_hash):
+        rng = self.rng
+        return Reader(email=f'reader{number}@example.com', password=password_hash, email_is_verified=True,
+                      first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+
+    def _history(self, cum_activity, today, days, skew, late_ratio):
+        rng = self.rng
+        first_day = today - timezone.timedelta(days=days)
+        span = days + 8
+        book_count = len(self.book_ids)
+        for index, book_id in enumerate(self.book_ids):
+            # share of the entries falling to the index-th most popular book
+            share = ((index + 1) / book_count) ** (1 / skew) - (index / book_count) ** (1 / skew)
+            entries = min(int(cum_activity[-1] * 2 * share + rng.random()), span // 6)
+            if not entries:
+                continue
+            length = span // entries
+            for segment in range(entries):
+                segment_start = first_day + timezone.timedelta(days=segment * length)
+                reader_id = rng.choices(self.reader_ids, cum_weights=cum_activity)[0]
+                # a checkout needs 14 days and at least one day of delay, a reservation at most 5
+                if segment_start <= today and length >= 17 and rng.random() < 0.5:
+                    checked_out_book = self._checked_out_book(reader_id, book_id, segment_start, length, today,
+                                                              late_ratio)
+                    yield checked_out_book
+                    if checked_out_book.end_date is None:
+                        break
+                else:
+                    yield self._reservation(reader_id, book_id, segment_start, length, today)
+
+    def _reservation(self, reader_id, book_id, segment_start, length, today):
+        rng = self.rng
+        duration = rng.randint(1, 5)
+        start_date = segment_start + timezone.timedelta(days=rng.randrange(0, length - duration))
+        end_date = start_date + timezone.timedelta(days=duration)
+        return Reservation(reader_id=reader_id, book_id=book_id, start_date=start_date, end_date=end_date,
+                           is_active=start_date <= today <= end_date, should_remind=rng.random() < 0.7)
+
+    def _checked_out_book(self, reader_id, book_id, segment_start, length, today, late_ratio):
+        rng = self.rng
+        if rng.random() < late_ratio:
+            duration = 14 + rng.randint(1, min(30, length - 16))
+        else:
+            duration = rng.randint(1, 14)
+        start_date = min(segment_start + timezone.timedelta(days=rng.randrange(0, length - max(duration, 14))),
+                         today)
+        end_date = start_date + timezone.timedelta(days=duration)
+        return CheckedOutBook(reader_id=reader_id, book_id=book_id, start_date=start_date,
+                              due_date=start_date + timezone.timedelta(days=14),
+                              end_date=end_date if end_date <= today else None,
+                              is_penalty_paid=rng.random() < 0.5)
+
+    def _mark_unavailable(self):
+        active_reservations = Reservation.objects.filter(book=OuterRef('pk'), is_active=True)
+        open_checkouts = CheckedOutBook.objects.filter(book=OuterRef('pk'), end_date__isnull=True)
+        Book.objects.filter(pk__gte=min(self.book_ids), pk__lte=max(self.book_ids)).filter(
+            Exists(active_reservations) | Exists(open_checkouts)).update(is_available=False)
+
+    def _bulk_create(self, name, objects, total, created_ids=None):
+        created = 0
+        started = time.perf_counter()
+        while True:
+            chunk = list(islice(objects, self.batch_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                for model in dict.fromkeys(type(obj) for obj in chunk):
+                    model.objects.bulk_create([obj for obj in chunk if type(obj) is model])
+            if created_ids is not None:
+                created_ids.extend(obj.pk for obj in chunk)
+            created += len(chunk)
+            elapsed = time.perf_counter() - started
+            self.progress(f'{name}: {created}/{total} ({created / elapsed:,.0f} rows/s)')
@@ -0,0 +1,83 @@
+function clearSuggestions(list) {
+    list.innerHTML = "";
+    list.style.display = "none";
+}
+
+function addSuggestion(list, text, detail, href) {
+    var item = document.createElement("li");
+    var link = document.createElement("a");
+    link.href = href;
+    link.textContent = text;
+    item.appendChild(link);
+    if (detail) {
+        var detailText = document.createElement("span");
+        detailText.className = "autocomplete_detail";
+        detailText.textContent = " " + detail;
+        item.appendChild(detailText);
+    }
+    list.appendChild(item);
+}
+
+document.addEventListener("DOMContentLoaded", function() {
+    var form = document.getElementById("search_form");
+    var input = document.getElementById("id_q");
+    if (!form || !input) {
+        return;
+    }
+    var list = document.createElement("ul");
+    list.className = "autocomplete_list";
+    input.parentNode.appendChild(list);
+    clearSuggestions(list);
+
+    var timer = null;
+    var lastQuery = "";
+    var controller = null;
+
+    input.addEventListener("input", function() {
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            var query = input.value.trim();
+            if (query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            if (controller) {
+                controller.abort();
+            }
+            if (query.length < 2) {
+                clearSuggestions(list);
+                return;
+            }
+            controller = new AbortController();
+            fetch(form.dataset.autocompleteUrl + "?q=" + encodeURIComponent(query), {signal: controller.signal})
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    clearSuggestions(list);
+                    data.titles.forEach(function(book) {
+                        addSuggestion(list, book.title, "by " + book.author,
+                                      form.dataset.bookUrl.replace(/0$/, book.id));
+                    });
+                    data.authors.forEach(function(author) {
+                        addSuggestion(list, author, "(author)",
+                                      form.action + "?q=" + encodeURIComponent(author));
+                    });
+                    if (list.children.length) {
+                        list.style.display = "block";
+                    }
+                })
+                .catch(function() {});
+        }, 150);
+    });
+
+    input.addEventListener("keydown", function(event) {
+        if (event.key === "Escape") {
+            clearSuggestions(list);
+        }
+    });
+
+    document.addEventListener("click", function(event) {
+        if (!form.contains(event.target)) {
+            clearSuggestions(list);
+        }
+    });
+});
@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import random
+import threading
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory, gettempdir
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core import mail, signing
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from lxml import etree
+
+from .autocomplete import autocomplete_index
+from .fragments import abook_versions, fragment_timeout, version_key
+from .fts import book_fts_enabled
+from .importing import BookImporter, read_jsonl
+from .middleware import QueryRecorder, QueryTimer, fingerprint, wrap_connections
+from .models import Book, CheckedOutBook, OutboxEmail, Reader, Reservation
+from .outbox import send_outbox_batch
+from .reminders import send_reservation_reminders
+from .search import CURSOR_SALT, _fts_keyset, search_books
+from .seeding import LibrarySeeder
+from .views import arender_account_history
+from .xslt import CHECKED_OUT_BOOKS_XSLT, RESERVATIONS_XSLT, XSLTRegistry
+
+ISBNS = itertools.count(1)
+
+
+def create_book(**overrides):
+    """
+    Create a book, Frank Herbert's Dune unless overridden, with an ISBN of its own.
+
+    Generated ISBNs start with 979, so they never collide with ISBNs passed explicitly or seeded.
+    """
+    fields = {'title': 'Dune', 'author': 'Frank Herbert', 'isbn': f'979{next(ISBNS):010d}', 'publisher': 'Ace',
+              'pub_year': 1965, 'image_url': 'https://example.com/dune.jpg'}
+    return Book.objects.create(**(fields | overrides))
+
+
+STYLESHEET = '''<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+    <xsl:template match="/"><p>{}</p></xsl:template>
+</xsl:stylesheet>'''
+
+
+class XSLTRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'page.xslt'
+        self.path.write_text(STYLESHEET.format('first'))
+        self.registry = XSLTRegistry()
+
+    def render(self, transform):
+        return str(transform(etree.fromstring('<page/>')))
+
+    def test_stylesheet_is_compiled_once(self):
+        with mock.patch('library.xslt.etree.XSLT', wraps=etree.XSLT) as compile_xslt:
+            transform = self.registry.get(self.path)
+            self.assertIs(self.registry.get(str(self.path)), transform)
+            self.assertIs(self.registry.get(self.path), transform)
+        self.assertEqual(compile_xslt.call_count, 1)
+        self.assertIn('<p>first</p>', self.render(transform))
+
+    def test_edited_stylesheet_is_recompiled(self):
+        transform = self.registry.get(self.path)
+        self.path.write_text(STYLESHEET.format('second'))
+        mtime = self.path.stat().st_mtime_ns + 1_000_000_000
+        os.utime(self.path, ns=(mtime, mtime))
+        edited = self.registry.get(self.path)
+        self.assertIsNot(edited, transform)
+        self.assertIn('<p>second</p>', self.render(edited))
+        self.assertIs(self.registry.get(self.path), edited)
+
+    def test_stylesheets_are_found_in_the_project(self):
+        for path in (RESERVATIONS_XSLT, CHECKED_OUT_BOOKS_XSLT):
+            self.assertTrue(path.is_relative_to(settings.BASE_DIR))
+            self.assertTrue(path.is_file())
+            self.assertIsInstance(self.registry.get(path), etree.XSLT)
+
+
+class AccountHistoryXMLTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['account'].clear()
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.today = timezone.now().date()
+
+    def add_history(self, count, title='Dune', add_info=None):
+        for _ in range(count):
+            book = create_book(title=title)
+            Reservation.objects.create(reader=self.reader, book=book, start_date=self.today,
+                                       end_date=self.today + timezone.timedelta(days=3), add_info=add_info)
+            CheckedOutBook.objects.create(reader=self.reader, book=book,
+                                          start_date=self.today - timezone.timedelta(days=20),
+                                          due_date=self.today - timezone.timedelta(days=10),
+                                          end_date=self.today - timezone.timedelta(days=5))
+
+    def test_text_is_escaped(self):
+        self.add_history(1, title='Tom & Jerry <Annotated>', add_info='Pick up <b>after</b> 5 & before 6')
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('account'))
+        self.assertContains(response, 'Tom &amp; Jerry &lt;Annotated&gt;', count=2)
+        self.assertContains(response, 'Pick up &lt;b&gt;after&lt;/b&gt; 5 &amp; before 6')
+        self.assertNotContains(response, '<Annotated>')
+        self.assertNotContains(response, '<b>after</b>')
+
+    def test_queries_do_not_grow_with_the_history(self):
+        query_counts = []
+        for count in (1, 10):
+            self.add_history(count)
+            with CaptureQueriesContext(connection) as queries:
+                async_to_sync(arender_account_history)(self.reader, None, None, False)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertLessEqual(query_counts[1], 2)
+
+
+class ReservationReminderTests(TestCase):
+
+    def setUp(self):
+        self.reader = Reader.objects.create_user('reader@example.com', 'password123')
+        self.book = create_book()
+        self.today = timezone.now().date()
+
+    def reserve(self, start_in_days, should_remind=True):
+        start_date = self.today + timezone.timedelta(days=start_in_days)
+        return Reservation.objects.create(reader=self.reader, book=self.book, start_date=start_date,
+                                          end_date=start_date + timezone.timedelta(days=3),
+                                          should_remind=should_remind)
+
+    def test_sends_due_reminders_once(self):
+        due = [self.reserve(1) for _ in range(25)]
+        self.reserve(1, should_remind=False)
+        self.reserve(10)
+
+        sent_count, failed_count = send_reservation_reminders(batch_size=10, workers=3)
+
+        self.assertEqual((sent_count, failed_count), (25, 0))
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertIn('Dune', mail.outbox[0].body)
+        self.assertFalse(Reservation.objects.filter(pk__in=[r.pk for r in due], reminder_sent_at__isnull=True))
+        self.assertEqual(send_reservation_reminders(), (0, 0))
+        self.assertEqual(len(mail.outbox), 25)
+
+    def test_failed_reminders_are_retried(self):
+        self.reserve(0)
+
+        sent_count, failed_count = send_reservation_reminders(backend='library.tests.FailingEmailBackend')
+
+        self.assertEqual((sent_count, failed_count), (0, 1))
+        self.assertEqual(send_reservation_reminders(), (1, 0))
+
+
+class ConcurrentReminderTests(TransactionTestCase):
+
+    def setUp(self):
+        reader = Reader.objects.create(email='reader@example.com')
+        book = create_book()
+        start_date = timezone.now().date() + timezone.timedelta(days=1)
+        Reservation.objects.bulk_create([Reservation(reader=reader, book=book, start_date=start_date,
+                                                     end_date=start_date, should_remind=True)
+                                         for _ in range(60)])
+
+    def test_simultaneous_runs_send_every_reminder_once(self):
+        start = threading.Barrier(4, timeout=10)
+        results = []
+
+        def run():
+            try:
+                start.wait()
+                results.append(send_reservation_reminders(batch_size=5, workers=2))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(sent_count for sent_count, failed_count in results), 60)
+        self.assertEqual(len(mail.outbox), 60)
+
+    def test_broken_connections_do_not_stop_the_run(self):
+        results = []
+
+        def run():
+            try:
+                results.append(send_reservation_reminders(
+                    batch_size=1, workers=1, backend='library.tests.BrokenConnectionEmailBackend'))
+            finally:
+                connection.close()
+
+        # a worker killed by the failing close used to leave run() blocked on the full batch queue
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [(0, 60)])
+        self.assertEqual(Reservation.objects.filter(reminder_sent_at__isnull=True).count(), 60)
+
+
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        self.reader = Reader.objects.create_user('reader@example.com', 'password123')
+
+    def test_views_only_enqueue_emails(self):
+        self.client.force_login(self.reader)
+        self.client.post(reverse('verify_email'))
+        self.client.post(reverse('password_reset'), {'email': 'reader@example.com'})
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count(), 2)
+
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 2)
+
+    def test_failed_emails_are_retried_with_backoff(self):
+        OutboxEmail.objects.enqueue('Subject', 'Body', ['reader@example.com'])
+
+        self.assertEqual(send_outbox_batch(max_attempts=2, backend='library.tests.FailingEmailBackend'), (0, 1))
+        outbox_email = OutboxEmail.objects.get()
+        self.assertEqual((outbox_email.status, outbox_email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(outbox_email.next_attempt_at, timezone.now())
+        self.assertEqual(send_outbox_batch(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        send_outbox_batch(max_attempts=2, backend='library.tests.FailingEmailBackend')
+        outbox_email.refresh_from_db()
+        self.assertEqual(outbox_email.status, OutboxEmail.FAILED)
+        self.assertIn('Mail server is down', outbox_email.last_error)
+
+    def test_errors_closing_the_connection_do_not_resend_emails(self):
+        for subject in ('First', 'Rejected', 'Second'):
+            OutboxEmail.objects.enqueue(subject, 'Body', ['reader@example.com'])
+
+        self.assertEqual(send_outbox_batch(backend='library.tests.UnclosableEmailBackend'), (2, 1))
+        self.assertEqual([message.subject for message in mail.outbox], ['First', 'Second'])
+        rejected = OutboxEmail.objects.get(subject='Rejected')
+        self.assertEqual((rejected.status, rejected.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn('Recipient rejected', rejected.last_error)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(), (1, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['First', 'Second', 'Rejected'])
+
+
+class ReservationAvailabilityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.book = create_book()
+        self.today = timezone.now().date()
+        Reservation.objects.create(reader=self.reader, book=self.book, start_date=self.days(5), end_date=self.days(8))
+
+    def days(self, days):
+        return self.today + timezone.timedelta(days=days)
+
+    def test_is_free_between(self):
+        self.assertTrue(self.book.is_free_between(self.today, self.days(4)))
+        self.assertFalse(self.book.is_free_between(self.days(3), self.days(5)))
+        self.assertFalse(self.book.is_free_between(self.days(8), self.days(9)))
+        self.assertTrue(self.book.is_free_between(self.days(9), self.days(12)))
+
+    def test_next_free_window(self):
+        self.assertEqual(self.book.next_free_window(4), self.today)
+        self.assertEqual(self.book.next_free_window(5), self.days(9))
+        self.assertEqual(self.book.next_free_window(2, from_date=self.days(3)), self.days(9))
+
+    def test_overdue_checkout_has_unknown_free_date(self):
+        CheckedOutBook.objects.create(reader=self.reader, book=self.book, start_date=self.days(-20),
+                                      due_date=self.days(-1))
+        Book.objects.filter(pk=self.book.pk).update(is_available=False)
+        self.assertFalse(self.book.is_free_between(self.days(30), self.days(31)))
+        self.assertIsNone(self.book.next_free_window(1))
+
+        self.client.force_login(self.reader)
+        url = reverse('book', kwargs={'book_id': self.book.id})
+        self.assertContains(self.client.get(url), 'the date it is free again is unknown')
+        response = self.client.post(url, {'start_date': self.days(30), 'how_long': 1})
+        self.assertContains(response, 'the date it can be reserved from is unknown')
+
+    def test_future_reservation_does_not_lock_book_today(self):
+        self.client.force_login(self.reader)
+        url = reverse('book', kwargs={'book_id': self.book.id})
+
+        response = self.client.post(url, {'start_date': self.days(3), 'how_long': 3})
+        self.assertContains(response, 'already reserved in this period')
+
+        response = self.client.post(url, {'start_date': self.today, 'how_long': 3})
+        self.assertRedirects(response, reverse('account'), fetch_redirect_response=False)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.is_available)
+
+
+class BookFragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.book = create_book()
+        self.url = reverse('book', kwargs={'book_id': self.book.id})
+
+    def test_cached_page_is_served_without_queries(self):
+        self.assertContains(self.client.get(self.url), 'Book is available!')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'Book is available!')
+        self.assertEqual(self.client.get(reverse('book', kwargs={'book_id': self.book.id + 1})).status_code, 404)
+
+    async def test_missing_fragment_is_rendered_from_the_book(self):
+        await Book.objects.filter(pk=self.book.pk).aupdate(is_available=False)
+        await self.async_client.aforce_login(self.reader)
+        self.assertContains(await self.async_client.get(self.url), 'Book is unavailable.')
+        version = (await abook_versions([self.book.id]))[self.book.id]
+        await cache.adelete(make_template_fragment_key('book_detail', [self.book.id, version]))
+        for _ in range(2):
+            response = await self.async_client.get(self.url)
+            self.assertContains(response, 'Book is unavailable.')
+            self.assertContains(response, 'Frank Herbert')
+            self.assertContains(response, 'it is free again from')
+
+    def test_changes_invalidate_fragments(self):
+        self.client.get(self.url)
+        self.client.get(reverse('search_results'), {'q': 'dune'})
+        self.client.force_login(self.reader)
+        today = timezone.now().date()
+        response = self.client.post(self.url, {'start_date': today, 'how_long': 3})
+        self.assertRedirects(response, reverse('account'), fetch_redirect_response=False)
+
+        self.client.logout()
+        self.assertContains(self.client.get(self.url), 'Book is unavailable.')
+        self.assertContains(self.client.get(reverse('search_results'), {'q': 'dune'}), 'Book is unavailable.')
+
+        Reservation.objects.filter(book=self.book).update(end_date=today - timezone.timedelta(days=1))
+        Reservation.objects.expire()
+        self.assertContains(self.client.get(self.url), 'Book is available!')
+
+    @override_settings(CACHE_IS_SHARED=False, LOCAL_FRAGMENT_TIMEOUT=0.2)
+    async def test_local_cache_keeps_fragments_and_versions_briefly(self):
+        self.assertEqual(fragment_timeout(), 0.2)
+        with override_settings(CACHE_IS_SHARED=True):
+            self.assertEqual(fragment_timeout(), settings.BOOK_FRAGMENT_TIMEOUT)
+        missing_id = self.book.id + 1
+        versions = await abook_versions([self.book.id, missing_id])
+        self.assertEqual(await abook_versions([self.book.id, missing_id]), versions)
+        await asyncio.sleep(0.3)
+        self.assertEqual(await cache.aget(version_key('book', missing_id)), None)
+        self.assertNotEqual(await abook_versions([self.book.id]), {self.book.id: versions[self.book.id]})
+
+
+class AccountHistoryCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['account'].clear()
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.book = create_book()
+        self.today = timezone.now().date()
+        self.client.force_login(self.reader)
+
+    def get_account(self, **filters):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('account'), filters)
+        history_queries = [query for query in queries.captured_queries
+                           if 'library_reservation' in query['sql'] and 'SELECT' in query['sql']]
+        return response, len(history_queries)
+
+    def test_history_is_rendered_once_per_version_and_filters(self):
+        response, history_queries = self.get_account()
+        self.assertTrue(history_queries)
+        self.assertNotContains(response, 'Dune')
+        self.assertEqual(self.get_account()[1], 0)
+        self.assertTrue(self.get_account(from_date=self.today, to_date=self.today, only_active='on')[1])
+
+        Reservation.objects.create(reader=self.reader, book=self.book, start_date=self.today,
+                                   end_date=self.today + timezone.timedelta(days=3))
+        response, history_queries = self.get_account()
+        self.assertTrue(history_queries)
+        self.assertContains(response, 'Dune')
+
+    def test_balance_change_invalidates_history(self):
+        self.get_account()
+        CheckedOutBook.objects.filter(reader=self.reader).update(is_counted=True)
+        CheckedOutBook.objects.bulk_create([CheckedOutBook(
+            reader=self.reader, book=self.book, start_date=self.today - timezone.timedelta(days=20),
+            due_date=self.today - timezone.timedelta(days=10), end_date=self.today - timezone.timedelta(days=5))])
+        response, history_queries = self.get_account()
+        self.assertTrue(history_queries)
+        self.assertContains(response, '-10.00')
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['account'].clear()
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.book = create_book()
+        self.today = timezone.now().date()
+        CheckedOutBook.objects.create(reader=self.reader, book=self.book,
+                                      start_date=self.today - timezone.timedelta(days=20),
+                                      due_date=self.today - timezone.timedelta(days=6),
+                                      end_date=self.today - timezone.timedelta(days=1))
+
+    async def test_views_under_asgi(self):
+        self.assertContains(await self.async_client.get(reverse('index')), 'Log in')
+        response = await self.async_client.get(reverse('search_results'), {'q': 'dune'})
+        self.assertContains(response, 'Book is available!')
+        url = reverse('book', kwargs={'book_id': self.book.id})
+        self.assertContains(await self.async_client.get(url), 'Frank Herbert')
+        timer = QueryTimer()
+        with wrap_connections(timer):
+            self.assertContains(await self.async_client.get(url), 'Frank Herbert')
+        self.assertEqual(timer.count, 0)
+        response = await self.async_client.get(reverse('book', kwargs={'book_id': self.book.id + 1}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_account_and_reservation(self):
+        response = await self.async_client.get(reverse('account'))
+        self.assertRedirects(response, f'/library/login?next={reverse("account")}', fetch_redirect_response=False)
+        with override_settings(LOGIN_URL='/accounts/login'):
+            response = await self.async_client.get(reverse('account'))
+        self.assertRedirects(response, f'/accounts/login?next={reverse("account")}', fetch_redirect_response=False)
+
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('account'))
+        self.assertContains(response, 'My Account')
+        self.assertContains(response, '&pound;-10.00')
+        self.assertContains(response, '<td>Dune')
+
+        url = reverse('book', kwargs={'book_id': self.book.id})
+        response = await self.async_client.post(url, {'start_date': self.today, 'how_long': 3})
+        self.assertRedirects(response, reverse('account'), fetch_redirect_response=False)
+        self.assertContains(await self.async_client.get(url), 'it is free again from')
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    async def test_queries_in_threads_are_instrumented(self):
+        with self.assertLogs('library.sql', 'INFO'):
+            response = await self.async_client.get(reverse('search_results'), {'q': 'dune'})
+        self.assertRegex(response['Server-Timing'], r'db;desc="SQL \([1-9]\d* queries\)"')
+
+
+class ReservationExpiryTests(TestCase):
+
+    def setUp(self):
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.today = timezone.now().date()
+
+    def reserve(self, book, start_in_days, end_in_days):
+        return Reservation.objects.create(reader=self.reader, book=book, is_active=True,
+                                          start_date=self.today + timezone.timedelta(days=start_in_days),
+                                          end_date=self.today + timezone.timedelta(days=end_in_days))
+
+    def test_expire_restores_availability_across_batches_and_is_idempotent(self):
+        free, reserved, checked_out = (create_book(is_available=False) for _ in range(3))
+        for _ in range(3):
+            self.reserve(free, -10, -2)
+        self.reserve(reserved, -10, -2)
+        current = self.reserve(reserved, -1, 2)
+        self.reserve(checked_out, -10, -1)
+        CheckedOutBook.objects.create(reader=self.reader, book=checked_out, start_date=self.today,
+                                      due_date=self.today + timezone.timedelta(days=14))
+
+        self.assertEqual(Reservation.objects.expire(batch_size=2), 5)
+        self.assertEqual(list(Reservation.objects.filter(is_active=True)), [current])
+        self.assertEqual({book.isbn: book.is_available for book in Book.objects.all()},
+                         {free.isbn: True, reserved.isbn: False, checked_out.isbn: False})
+
+        updated_at = dict(Book.objects.values_list('pk', 'updated_at'))
+        self.assertEqual(Reservation.objects.expire(batch_size=2), 0)
+        self.assertEqual(dict(Book.objects.values_list('pk', 'updated_at')), updated_at)
+
+
+class PenaltyTests(TestCase):
+
+    def setUp(self):
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.book = create_book()
+        self.today = timezone.now().date()
+
+    def check_out(self, due_date, end_date=None):
+        return CheckedOutBook.objects.create(reader=self.reader, book=self.book,
+                                             start_date=due_date - timezone.timedelta(days=14),
+                                             due_date=due_date, end_date=end_date)
+
+    def test_penalty_expression_matches_calculate_penalty(self):
+        due_date = timezone.datetime(2023, 12, 28).date()
+        for days_late in (None, -3, 0, 1, 4, 40, 400):
+            self.check_out(due_date, None if days_late is None else due_date + timezone.timedelta(days=days_late))
+        for checked_out_book in CheckedOutBook.objects.with_penalty():
+            self.assertEqual(checked_out_book.penalty, Decimal(str(checked_out_book.calculate_penalty())),
+                             checked_out_book.end_date)
+
+    def test_books_are_charged_once_after_they_are_returned(self):
+        overdue = self.check_out(self.today - timezone.timedelta(days=5))
+        self.check_out(self.today - timezone.timedelta(days=10), self.today - timezone.timedelta(days=7))
+        self.reader.update_balance()
+        self.assertEqual(self.reader.balance, Decimal('-6.00'))
+        overdue.refresh_from_db()
+        self.assertFalse(overdue.is_counted)
+
+        overdue.end_date = self.today
+        overdue.save()
+        self.reader.update_balance()
+        self.reader.update_balance()
+        self.assertEqual(self.reader.balance, Decimal('-16.00'))
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.balance, Decimal('-16.00'))
+        self.assertFalse(CheckedOutBook.objects.filter(is_counted=False))
+
+
+# a cache shared by processes, as CACHE_BACKEND would configure in production
+SHARED_CACHE_SETTINGS = {
+    'CACHES': {**settings.CACHES, 'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                              'LOCATION': os.path.join(gettempdir(), 'library-test-cache')}},
+    'CACHE_IS_SHARED': True,
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'AUTHENTICATION_BACKENDS': ['library.auth.CachedReaderBackend'],
+}
+
+
+@override_settings(**SHARED_CACHE_SETTINGS)
+class AuthenticatedRequestTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reader = Reader.objects.create_user('reader@example.com', 'password123', first_name='Ann')
+        self.book = create_book()
+        self.today = timezone.now().date()
+        self.assertTrue(self.client.login(email='reader@example.com', password='password123'))
+
+    def check_out(self, days_late):
+        return CheckedOutBook.objects.create(reader=self.reader, book=self.book,
+                                             start_date=self.today - timezone.timedelta(days=20),
+                                             due_date=self.today - timezone.timedelta(days=10),
+                                             end_date=self.today - timezone.timedelta(days=10 - days_late))
+
+    def test_session_and_reader_come_from_the_cache(self):
+        self.assertContains(self.client.get(reverse('index')), 'My Account')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse('index')), 'My Account')
+
+    def test_reader_changes_drop_the_cached_reader(self):
+        self.assertContains(self.client.get(reverse('account')), 'Welcome, Ann')
+        self.reader.first_name = 'Anna'
+        self.reader.save()
+        self.assertContains(self.client.get(reverse('account')), 'Welcome, Anna')
+
+        self.check_out(days_late=5)
+        self.assertContains(self.client.get(reverse('account')), '&pound;-10.00')
+        self.assertContains(self.client.get(reverse('account')), '&pound;-10.00')
+
+        self.reader.set_password('new-password')
+        self.reader.save()
+        self.assertRedirects(self.client.get(reverse('account')), f'/library/login?next={reverse("account")}',
+                             fetch_redirect_response=False)
+
+    def test_logout_ends_the_session_in_other_processes(self):
+        self.assertContains(self.client.get(reverse('index')), 'My Account')
+        # the cache client of another worker process
+        other_cache = caches.create_connection('default')
+        session_key = self.client.cookies['sessionid'].value
+        other_session = SessionStore(session_key)
+        other_session._cache = other_cache
+        self.assertIn('_auth_user_id', other_session.load())
+
+        self.client.post(reverse('logout'))
+        other_session = SessionStore(session_key)
+        other_session._cache = other_cache
+        self.assertEqual(other_session.load(), {})
+
+    @override_settings(CACHE_IS_SHARED=False, SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_readers_are_not_cached_in_process_memory(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertTrue([query for query in queries if 'FROM "library_reader"' in query['sql']])
+
+    def test_zero_penalty_does_not_write_the_reader(self):
+        self.check_out(days_late=0)
+        with CaptureQueriesContext(connection) as queries:
+            self.reader.update_balance()
+            self.reader.update_balance()
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('UPDATE "library_checkedoutbook"', writes[0])
+
+
+class SignUpTests(TestCase):
+
+    def setUp(self):
+        self.data = {'first_name': 'Ann', 'last_name': 'Reader', 'email': 'ann@example.com',
+                     'password1': 'correct-horse-9', 'password2': 'correct-horse-9'}
+
+    def test_password_is_hashed_once_and_reader_logged_in(self):
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', autospec=True,
+                               side_effect=PBKDF2PasswordHasher.encode) as encode:
+            response = self.client.post(reverse('sign_up'), self.data)
+        self.assertRedirects(response, reverse('verify_email'), fetch_redirect_response=False)
+        self.assertEqual(encode.call_count, 1)
+        reader = Reader.objects.get(email='ann@example.com')
+        self.assertTrue(reader.check_password('correct-horse-9'))
+        self.assertEqual(int(self.client.session['_auth_user_id']), reader.pk)
+
+    def test_taken_email_is_a_single_lookup(self):
+        Reader.objects.create_user('ann@example.com', 'password123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('sign_up'), self.data)
+        self.assertContains(response, 'This Email already exists')
+        self.assertEqual(len([query for query in queries if 'library_reader' in query['sql']]), 1)
+        self.assertEqual(Reader.objects.count(), 1)
+
+
+class BookSearchTests(TestCase):
+
+    def titles(self, query):
+        return [book.title for book in search_books(query).books]
+
+    def test_index_and_triggers_are_installed(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'library_book'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(triggers, {'library_book_fts_ai', 'library_book_fts_ad', 'library_book_fts_au'})
+        self.assertTrue(book_fts_enabled())
+
+    def test_title_hits_rank_above_publisher_hits(self):
+        create_book(title='Collected Stories', author='Various', publisher='Dune Press')
+        create_book(title='Dune')
+        create_book(title='Children of Dune', author='Brian Herbert')
+        self.assertEqual(self.titles('dune'), ['Dune', 'Children of Dune', 'Collected Stories'])
+        self.assertEqual(self.titles('dun herb'), ['Dune', 'Children of Dune'])
+        # FTS5 syntax typed by users is taken as plain words
+        self.assertEqual(self.titles('dune* "('), ['Dune', 'Children of Dune', 'Collected Stories'])
+        self.assertEqual(self.titles('dune OR emma'), [])
+        self.assertEqual(self.titles('!!!'), [])
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        book = create_book(title='Dune')
+        self.assertEqual(self.titles('dune'), ['Dune'])
+        book.title = 'Emma'
+        book.author = 'Jane Austen'
+        book.save()
+        self.assertEqual(self.titles('dune'), [])
+        self.assertEqual(self.titles('austen'), ['Emma'])
+        Book.objects.filter(pk=book.pk).update(publisher='Penguin')
+        self.assertEqual(self.titles('penguin'), ['Emma'])
+        book.delete()
+        self.assertEqual(self.titles('emma'), [])
+
+    def test_orm_fallback_without_the_index(self):
+        create_book(title='Dune', isbn='9780441013593')
+        create_book(title='Emma', author='Jane Austen')
+        with mock.patch('library.search.book_fts_enabled', return_value=False):
+            self.assertEqual(self.titles('UNE'), ['Dune'])
+            self.assertEqual(self.titles('0441'), ['Dune'])
+            self.assertEqual(self.titles('austen'), ['Emma'])
+
+    def page_through(self, query, page_size):
+        pages = [search_books(query, page_size=page_size)]
+        while pages[-1].next_cursor:
+            pages.append(search_books(query, cursor=pages[-1].next_cursor, page_size=page_size))
+        return pages
+
+    def assertPagesBackwards(self, pages, page_size):
+        for page, previous in zip(pages[1:], pages):
+            back = search_books('dune', cursor=page.prev_cursor, page_size=page_size)
+            self.assertEqual(back.books, previous.books)
+            self.assertEqual(bool(back.prev_cursor), bool(previous.prev_cursor))
+            self.assertTrue(back.next_cursor)
+
+    def test_cursors_page_through_rank_ties(self):
+        dunes = [create_book(title='Dune') for _ in range(5)]
+        children = [create_book(title='Children of Dune') for _ in range(3)]
+        ranks = [rank for rank, book_id in _fts_keyset('dune', None, None, 10)]
+        self.assertEqual(len(set(ranks)), 2)
+
+        pages = self.page_through('dune', 3)
+        self.assertEqual([page.books for page in pages], [dunes[:3], dunes[3:] + children[:1], children[1:]])
+        self.assertIsNone(pages[0].prev_cursor)
+        self.assertIsNone(pages[-1].next_cursor)
+        self.assertPagesBackwards(pages, 3)
+
+    def test_orm_fallback_cursors(self):
+        books = [create_book(title='Dune') for _ in range(5)]
+        with mock.patch('library.search.book_fts_enabled', return_value=False):
+            pages = self.page_through('dune', 2)
+            self.assertEqual([page.books for page in pages], [books[:2], books[2:4], books[4:]])
+            self.assertPagesBackwards(pages, 2)
+
+    def test_invalid_cursors_return_the_first_page(self):
+        books = [create_book(title='Dune') for _ in range(3)]
+        cursor = search_books('dune', page_size=1).next_cursor
+        for invalid in (cursor[:-2] + ('AA' if cursor[-2:] != 'AA' else 'BB'),
+                        signing.dumps({'d': 'next', 'k': [0, books[0].pk]}, salt='another.salt', compress=True),
+                        signing.dumps({'d': 'sideways', 'k': [0, books[0].pk]}, salt=CURSOR_SALT, compress=True),
+                        signing.dumps({'d': 'next', 'k': [books[0].pk]}, salt=CURSOR_SALT, compress=True),
+                        'not-a-cursor'):
+            page = search_books('dune', cursor=invalid, page_size=1)
+            self.assertEqual(page.books, books[:1])
+            self.assertIsNone(page.prev_cursor)
+
+
+# the seeder rebuilds the full-text index with the schema editor, which cannot run inside a test transaction
+class SeedingTests(TransactionTestCase):
+
+    def test_seeded_history_keeps_model_invariants(self):
+        create_book(isbn='9780000000100')
+        Reader.objects.create(email='reader3@example.com')
+        seeder = LibrarySeeder(random.Random(1), batch_size=50)
+        seeder.seed_books(100)
+        seeder.seed_readers(20, 'password')
+        seeder.seed_history(per_reader=10, days=120, skew=2.0)
+
+        self.assertEqual(Book.objects.filter(pk=seeder.book_ids[0]).get().isbn, '9780000000101')
+        self.assertEqual(Reader.objects.filter(email__in=['reader4@example.com', 'reader23@example.com']).count(), 2)
+        self.assertTrue(Reservation.objects.exists() and CheckedOutBook.objects.exists())
+        today = timezone.now().date()
+        periods = {}
+        for book_id, start_date, end_date in Reservation.objects.values_list('book_id', 'start_date', 'end_date'):
+            periods.setdefault(book_id, []).append((start_date, end_date))
+        for book_id, start_date, due_date, end_date in CheckedOutBook.objects.values_list(
+                'book_id', 'start_date', 'due_date', 'end_date'):
+            self.assertLessEqual(start_date, today)
+            periods.setdefault(book_id, []).append((start_date, end_date or max(due_date, today)))
+        for book_periods in periods.values():
+            book_periods.sort()
+            for (_, end_date), (next_start_date, _) in zip(book_periods, book_periods[1:]):
+                self.assertLess(end_date, next_start_date)
+        unavailable = set(Reservation.objects.filter(is_active=True).values_list('book_id', flat=True))
+        unavailable |= set(CheckedOutBook.objects.filter(end_date__isnull=True).values_list('book_id', flat=True))
+        self.assertEqual(set(Book.objects.filter(is_available=False).values_list('pk', flat=True)), unavailable)
+
+
+class ImportBooksTests(TestCase):
+
+    def test_csv_import_upserts_on_isbn(self):
+        book = create_book(isbn='9780441013593', is_available=False)
+        csv_file = NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False)
+        self.addCleanup(os.remove, csv_file.name)
+        with csv_file:
+            csv_file.write('title,author,isbn,publisher,pub_year,image_url\n'
+                           'Dune Messiah,Frank Herbert,978-0-441-01359-3,Ace,1969,https://example.com/dune.jpg\n'
+                           'Emma,Jane Austen,0141439580,Penguin,1815,https://example.com/emma.jpg\n'
+                           'Broken,Nobody,9780141439588,Penguin,year,not-a-url\n')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', csv_file.name, '--batch-size', '1', stdout=stdout, stderr=stderr)
+
+        self.assertIn('Imported 2 book(s)', stdout.getvalue())
+        self.assertIn('Line 4: isbn: "9780141439588" has a wrong check digit. pub_year: "year" is not a year. '
+                      'image_url: Enter a valid URL.', stderr.getvalue())
+        book.refresh_from_db()
+        self.assertEqual((book.title, book.pub_year, book.is_available), ('Dune Messiah', 1969, False))
+        self.assertTrue(Book.objects.filter(isbn='0141439580', title='Emma').exists())
+        self.assertEqual([found.pk for found in search_books('messiah').books], [book.pk])
+
+    def test_jsonl_rows_with_wrong_types_are_skipped(self):
+        rows = [json.dumps({'title': 'Emma', 'author': 'Jane Austen', 'isbn': '0141439580', 'publisher': 'Penguin',
+                            'pub_year': pub_year, 'image_url': 'https://example.com/emma.jpg'})
+                for pub_year in ([1815], {'year': 1815}, 1815)]
+        errors = []
+        importer = BookImporter(error=errors.append)
+        importer.run(read_jsonl(StringIO('\n'.join(rows))))
+        self.assertEqual((importer.imported, importer.invalid), (1, 2))
+        self.assertEqual(errors, ['Line 1: pub_year: "[1815]" is not a year.',
+                                  "Line 2: pub_year: \"{'year': 1815}\" is not a year."])
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.reader = Reader.objects.create(email='reader@example.com')
+        self.staff = Reader.objects.create(email='staff@example.com', is_staff=True)
+        book = create_book(isbn='9780441013593')
+        self.today = timezone.now().date()
+        for days in (-10, 0, 10):
+            start_date = self.today + timezone.timedelta(days=days)
+            Reservation.objects.create(reader=self.reader, book=book, start_date=start_date,
+                                       end_date=start_date + timezone.timedelta(days=3), is_active=days == 0)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('export', kwargs={'name': name}), params)
+        return response, b''.join(response.streaming_content).decode() if response.streaming else None
+
+    def test_export_is_staff_only(self):
+        self.client.force_login(self.reader)
+        response, _ = self.export('books')
+        self.assertEqual(response.status_code, 302)
+
+    def test_filtered_exports(self):
+        self.client.force_login(self.staff)
+        response, content = self.export('reservations', from_date=self.today, to_date=self.today)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,reader__email,book__isbn,book__title,start_date,end_date,is_active,'
+                                   'should_remind,add_info')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(f'reader@example.com,9780441013593,Dune,{self.today}', lines[1])
+
+        _, content = self.export('reservations', format='jsonl', only_active='on')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['start_date'] for row in rows], [str(self.today)])
+
+        _, content = self.export('books', format='jsonl')
+        self.assertEqual(json.loads(content)['isbn'], '9780441013593')
+        self.assertEqual(self.export('reservations', from_date='yesterday')[0].status_code, 400)
+        self.assertEqual(self.export('readers')[0].status_code, 404)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('export', kwargs={'name': 'reservations'}),
+                                               {'format': 'jsonl'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertEqual(json.loads(content.splitlines()[0])['book__isbn'], '9780441013593')
+
+
+class BookAPITests(TestCase):
+
+    def setUp(self):
+        for i in range(3):
+            self.book = create_book(title=f'Dune {i}', isbn=f'978044101359{i}')
+
+    def test_search_fields_and_cursor_paging(self):
+        response = self.client.get(reverse('api_books'), {'q': 'dune', 'fields': 'title', 'page_size': 2})
+        page = response.json()
+        self.assertEqual(page['results'], [{'id': self.book.id - 2, 'title': 'Dune 0'},
+                                           {'id': self.book.id - 1, 'title': 'Dune 1'}])
+        page = self.client.get(reverse('api_books'), {'q': 'dune', 'fields': 'isbn', 'cursor': page['next_cursor']}).json()
+        self.assertEqual(page['results'], [{'id': self.book.id, 'isbn': '9780441013592'}])
+        self.assertEqual(self.client.get(reverse('api_books'), {'q': 'dune', 'fields': 'password'}).status_code, 400)
+
+    def test_conditional_get(self):
+        url = reverse('api_book', kwargs={'book_id': self.book.id})
+        response = self.client.get(url, {'fields': 'title,is_available'})
+        self.assertEqual(response.json(), {'id': self.book.id, 'title': 'Dune 2', 'is_available': True})
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        search_etag = self.client.get(reverse('api_books'), {'q': 'dune'})['ETag']
+
+        Reservation.objects.create(reader=Reader.objects.create(email='reader@example.com'), book=self.book,
+                                   start_date=timezone.now().date(), end_date=timezone.now().date())
+        Reservation.objects.activate_started()
+        response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_available'])
+        response = self.client.get(reverse('api_books'), {'q': 'dune'}, headers={'If-None-Match': search_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_book', kwargs={'book_id': self.book.id + 1})).status_code, 404)
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        autocomplete_index.clear()
+        self.addCleanup(autocomplete_index.clear)
+        self.dune = create_book()
+        create_book(title='Dune Messiah', pub_year=1969)
+        create_book(title='Émile', author='Jean-Jacques Rousseau', publisher='Penguin', pub_year=1762)
+
+    def suggest(self, query):
+        return self.client.get(reverse('autocomplete'), {'q': query}).json()
+
+    def test_suggestions_come_from_memory(self):
+        self.suggest('d')
+        with self.assertNumQueries(0):
+            suggestions = self.suggest('  DUNE m')
+        self.assertEqual([book['title'] for book in suggestions['titles']], ['Dune Messiah'])
+        self.assertEqual(self.suggest('emi')['titles'][0]['title'], 'Émile')
+        self.assertEqual(self.suggest('fra')['authors'], ['Frank Herbert'])
+
+    def test_index_follows_book_changes(self):
+        self.suggest('d')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dune.title = 'Children of Dune'
+            self.dune.save()
+            create_book(title='Dracula', author='Bram Stoker', publisher='Penguin', pub_year=1897)
+        self.assertEqual([book['title'] for book in self.suggest('d')['titles']], ['Dracula', 'Dune Messiah'])
+        self.assertEqual(self.suggest('child')['titles'], [{'id': self.dune.id, 'title': 'Children of Dune',
+                                                            'author': 'Frank Herbert'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(title__startswith='Dune').delete()
+        self.assertEqual(self.suggest('frank')['authors'], ['Frank Herbert'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dune.delete()
+        self.assertEqual(self.suggest('frank')['authors'], [])
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+
+    def setUp(self):
+        self.book = create_book()
+        self.readers = [Reader.objects.create(email=f'reader{i}@example.com') for i in range(20)]
+
+    def test_only_one_of_many_simultaneous_reservations_succeeds(self):
+        start = threading.Barrier(len(self.readers), timeout=10)
+        results = []
+        clients = []
+        for reader in self.readers:
+            client = Client()
+            client.force_login(reader)
+            clients.append(client)
+
+        def reserve(client):
+            try:
+                start.wait()
+                response = client.post(reverse('book', kwargs={'book_id': self.book.id}),
+                                       {'start_date': timezone.now().date(), 'how_long': 3})
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), len(self.readers))
+        self.assertEqual(results.count(302), 1)
+        self.assertEqual(results.count(200), len(self.readers) - 1)
+        self.assertEqual(Reservation.objects.filter(book=self.book).count(), 1)
+        self.book.refresh_from_db()
+        self.assertFalse(self.book.is_available)
+
+
+class SQLiteProfileTests(TransactionTestCase):
+
+    def test_connection_settings(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Reader.objects.count()
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_concurrent_read_write_transactions_do_not_fail(self):
+        # update_balance reads the penalties before writing; with a deferred BEGIN, transactions running in
+        # parallel fail with "database is locked" when they try to write; the stress_db command compares the
+        # throughput and lock wait of both backends
+        book = create_book()
+        readers = [Reader.objects.create(email=f'reader{i}@example.com') for i in range(8)]
+        today = timezone.now().date()
+        start = threading.Barrier(len(readers), timeout=10)
+        errors = []
+
+        def charge(reader):
+            try:
+                start.wait()
+                for _ in range(10):
+                    CheckedOutBook.objects.create(reader=reader, book=book,
+                                                  start_date=today - timezone.timedelta(days=20),
+                                                  due_date=today - timezone.timedelta(days=10),
+                                                  end_date=today - timezone.timedelta(days=5))
+                    reader.update_balance()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=charge, args=(reader,)) for reader in readers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for reader in readers:
+            reader.refresh_from_db()
+            self.assertEqual(reader.balance, -100)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs the queries behind the hot paths through EXPLAIN QUERY PLAN and fails on full table scans,
+    so a model change which drops an index used by them is caught by the test suite.
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is specific to SQLite.')
+        self.reader = Reader.objects.create(email='reader@example.com')
+        today = timezone.now().date()
+        for i in range(10):
+            book = create_book(title=f'Dune {i}')
+            Reservation.objects.create(reader=self.reader, book=book, start_date=today,
+                                       end_date=today + timezone.timedelta(days=3))
+            CheckedOutBook.objects.create(reader=self.reader, book=book, start_date=today - timezone.timedelta(days=20),
+                                          due_date=today - timezone.timedelta(days=10),
+                                          end_date=today - timezone.timedelta(days=i))
+        self.book = book
+        self.client.force_login(self.reader)
+
+    def assertNoFullTableScans(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        # sqlite_master is only read once per process, when checking for the full-text index
+        statements = [query['sql'] for query in queries.captured_queries
+                      if query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')) and 'sqlite_master' not in query['sql']]
+        self.assertTrue(statements)
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if step.startswith('SCAN ') and 'VIRTUAL TABLE' not in step]
+            self.assertFalse(scans, f'Full table scan in query plan of:\n{sql}\n' + '\n'.join(plan))
+
+    def test_search_results(self):
+        self.assertNoFullTableScans(lambda: self.client.get(reverse('search_results'), {'q': 'dune herb'}))
+
+    def test_account(self):
+        self.assertNoFullTableScans(lambda: self.client.get(reverse('account')))
+        self.assertNoFullTableScans(lambda: self.client.get(reverse('account'), {
+            'from_date': timezone.now().date(), 'to_date': timezone.now().date(), 'only_active': 'on'}))
+
+    def test_book_view(self):
+        self.assertNoFullTableScans(lambda: self.client.get(reverse('book', kwargs={'book_id': self.book.id})))
+
+    def test_update_balance(self):
+        self.assertNoFullTableScans(self.reader.update_balance)
+
+
+@override_settings(SQL_INSTRUMENTATION=True, SQL_REPEATED_QUERY_THRESHOLD=3)
+class SQLInstrumentationTests(TestCase):
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('library.sql', 'INFO') as logs:
+            response = self.client.get(reverse('search_results'), {'q': 'dune'})
+        self.assertRegex(response['Server-Timing'], r'db;desc="SQL \(\d+ queries\)";dur=[\d.]+, total;dur=[\d.]+')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('"view": "search_results"', logs.output[0])
+
+    def test_repeated_statements_are_flagged(self):
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'a''b' AND x IN (%s, %s)"),
+                         'SELECT * FROM t WHERE id = ? AND name = ? AND x IN (?)')
+        books = [create_book(title=f'Dune {i}') for i in range(3)]
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            list(Book.objects.all())
+            for book in books:
+                Book.objects.get(pk=book.pk)
+        self.assertEqual(recorder.count, 4)
+        repeated = recorder.repeated(3)
+        self.assertEqual(len(repeated), 1)
+        self.assertIn('"library_book"."id" = ?', repeated[0][0])
+        self.assertEqual(repeated[0][1], 3)
+
+
+def reload_urlconf():
+    clear_url_caches()
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reload_urlconf()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        reload_urlconf()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('search_results'), {'q': 'dune'})
+        self.client.get('/library/missing-page')
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertRegex(body, r'library_request_duration_seconds_count\{method="GET",view="search_results"\} [1-9]')
+        self.assertRegex(body, r'library_responses_total\{method="GET",status="200",view="search_results"\} [1-9]')
+        self.assertRegex(body, r'library_responses_total\{method="GET",status="404",view="<unmatched>"\} [1-9]')
+        self.assertIn('library_request_db_seconds_bucket{le="0.001",view="search_results"}', body)
+
+    def test_metrics_require_the_token_or_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.client.force_login(Reader.objects.create(email='reader@example.com'))
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(Reader.objects.create(email='staff@example.com', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_metrics_are_not_routed_when_disabled(self):
+        with override_settings(METRICS_ENABLED=False):
+            reload_urlconf()
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        reload_urlconf()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('Mail server is down.')
+
+
+class BrokenConnectionEmailBackend(FailingEmailBackend):
+
+    def close(self):
+        raise ConnectionError('Connection reset by peer.')
+
+
+class UnclosableEmailBackend(locmem.EmailBackend):
+
+    def send_messages(self, messages):
+        if any(message.subject == 'Rejected' for message in messages):
+            raise ConnectionError('Recipient rejected.')
+        return super().send_messages(messages)
+
+    def close(self):
+        raise ConnectionError('Connection reset by peer.')
@@ -1,111 +1,188 @@
+import asyncio
 import os
 
-from django.contrib.auth.decorators import login_required
+from asgiref.sync import sync_to_async
 from django.contrib.sites.shortcuts import get_current_site
-from django.db.models import Q
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from .forms import SearchForm
-from .models import Book, Reservation, CheckedOutBook
+from .models import Book, Reservation, CheckedOutBook, OutboxEmail
 from .models import Reader, ReaderManager
+from .search import search_books, SearchPage
 from .forms import UserRegisterForm
 from .forms import ReservationForm
-from django.contrib.auth import login, authenticate
-from django.core.mail import EmailMessage
+from django.contrib.auth import alogin
 from .tokens import account_activation_token
 from django.contrib import messages
 from .forms import FilterReservationsForm
 from django.utils import timezone
 from lxml import etree
+from .xslt import xslt_registry, RESERVATIONS_XSLT, CHECKED_OUT_BOOKS_XSLT
+from .metrics import render_metrics
+from .fragments import aaccount_history, abook_versions, arender_book_rows, fragment_timeout
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from .exports import EXPORTS, EXPORT_FORMATS, aexport_rows, astream_export, export_rows, stream_export
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from .forms import ExportFilterForm
+from django.db import IntegrityError
+from django.db.models import Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from .autocomplete import autocomplete_index
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.safestring import mark_safe
+from django.shortcuts import aget_object_or_404
+from .xslt import xslt_executor
+
+
+async def aload_user(request):
+    """
+    Load the user of a request in an async view and store it in request.user.
+
+    request.user loads the user lazily with a blocking query, which is not allowed in the event loop, so async
+    views load it with request.auser() before rendering templates which use it.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :return: The authenticated Reader or AnonymousUser.
+    """
+    request.user = await request.auser()
+    return request.user
 
 
-def index(request):
+async def index(request):
     """
     View function for rendering the main index page.
 
     This view function handles the rendering of the main index page, typically representing the home page of the
     website. It initializes a SearchForm using the request's GET parameters, if any, and passes it to the
     'index.html' template.
+    Like search_results, book_view and account, it is an async view, so under ASGI it is served in the event loop
+    without a thread per request.
 
     :param request: (HttpRequest) The HTTP request object.
     :return: The rendered HTML response containing the 'index.html' template with the initialized SearchForm.
     """
+    await aload_user(request)
     form = SearchForm(request.GET or None)
     return render(request, 'index.html', {'form': form})
 
 
-def search_results(request):
+async def search_results(request):
     """
     View function for handling search results.
 
     This view function processes the search form submitted via GET request. It initializes a SearchForm using the
     request's GET parameters and validates it. If the form is valid, it extracts the search query from the cleaned
-    data and filters books by Title, Author and ISBN. The results are then passed to the 'search_results.html'
-    template for rendering.
+    data and looks up matching books in the full-text index (see search_books), ranked by relevance.
+    Results are paginated with opaque keyset cursors passed in the 'cursor' GET parameter, so every page costs
+    a single bounded query. The rows of the page are rendered once per book version and cached (see
+    arender_book_rows), and the page is then passed to the 'search_results.html' template for rendering.
+    The full-text query uses a raw cursor, for which Django has no async API, so search_books runs in a thread.
 
     :param request: (HttpRequest) The HTTP request object.
     :return: The rendered HTML response containing the 'search_results.html' template with search results.
     """
+    await aload_user(request)
     form = SearchForm(request.GET)
 
     if form.is_valid():
         query = form.cleaned_data.get('q', '')
-        books = Book.objects.all()
 
         if query:
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(isbn__icontains=query)
-            )
+            page = await sync_to_async(search_books)(query, cursor=request.GET.get('cursor'))
         else:
-            books = []
+            page = SearchPage([])
     else:
         query = ''
-        books = []
+        page = SearchPage([])
 
     return render(request, 'search_results.html', {'query': query,
-                                                   'books': books,
+                                                   'books': page.books,
+                                                   'rows': await arender_book_rows(page.books),
+                                                   'page': page,
                                                    'form': form})
 
 
-def book_view(request, book_id):
+async def book_view(request, book_id):
     """
     View function for displaying details of a specific book and handling reservations.
 
     This view function retrieves the details of a book with the given ID from the database.
-    If the request method is POST, it initializes a ReservationForm using the POST data.
+    If the request method is POST, it initializes a ReservationForm using the POST data and, if the form is valid,
+    reserves the book atomically (see ReservationQuerySet.reserve) and redirects to the user's account.
+    Periods overlapping other reservations are rejected by the form, and if another reader reserved the book
+    in the meantime, the form is shown again with an error.
     Otherwise, it initializes an empty ReservationForm.
     The book details and the reservation form are then passed to the 'book.html' template for rendering.
 
+    The book details are cached template fragments keyed by the book id and its version, which changes whenever
+    the book, its reservations or its checkouts change (see library.fragments). The fragments are looked up
+    before rendering: if all of them are cached, the page is rendered from them without loading the book,
+    otherwise the book is loaded and the template renders and caches the missing fragments. Form validation and
+    the reservation use transactions and run in a thread.
+
     :param request: (HttpRequest) The HTTP request object.
     :param book_id: (int) The ID of the book to display.
     :return: The rendered HTML response containing the 'book.html' template with book details and reservation form.
     """
-    book = Book.objects.get(id=book_id)
-    if request.method == 'POST':
-        form = ReservationForm(request.POST)
-        if form.is_valid():
+    user = await aload_user(request)
+    book = None
+    if request.method == 'POST' and user.is_authenticated:
+        book = await aget_object_or_404(Book, id=book_id)
+        form = ReservationForm(request.POST, book=book)
+        if await sync_to_async(form.is_valid)():
             reservation = form.save(commit=False)
-            book.is_available = False
             reservation.book = book
-            reservation.reader = request.user
-            reservation.save()
+            reservation.reader = user
+            if await sync_to_async(Reservation.objects.reserve)(reservation):
+                return redirect('account')
+            form.add_error(None, 'Sorry, this book has just been reserved by another reader for this period.')
     else:
         form = ReservationForm()
+
+    book_version = (await abook_versions([book_id]))[book_id]
+    today = timezone.now().date()
+    fragments = [('book_title', [book_id, book_version]), ('book_detail', [book_id, book_version])]
+    if user.is_authenticated:
+        fragments.append(('book_free_note', [book_id, book_version, today]))
+    keys = [make_template_fragment_key(name, vary_on) for name, vary_on in fragments]
+    cached = await cache.aget_many(keys)
+    if len(cached) == len(keys):
+        # the fragments fetched here are rendered as they are, so evicting them now does not matter
+        return render(request, 'book.html', {'cached_fragments': {name: mark_safe(cached[key])
+                                                                  for (name, _), key in zip(fragments, keys)},
+                                             'form': form})
+    book = book or await aget_object_or_404(Book, id=book_id)
+    next_free_date = None
+    if user.is_authenticated and not book.is_available:
+        next_free_date = await sync_to_async(book.next_free_window)(1)
     return render(request, 'book.html', {'book': book,
-                                         'form': form})
+                                         'book_id': book_id,
+                                         'book_version': book_version,
+                                         'fragment_timeout': fragment_timeout(),
+                                         'today': today,
+                                         'form': form,
+                                         'next_free_date': next_free_date})
 
 
-def sign_up(request):
+async def sign_up(request):
     """
     View function for handling user registration.
 
     This view function handles both GET and POST requests for user registration.
     If the request method is POST, it initializes a UserRegisterForm using the POST data.
-    If the form is valid, it creates a new user, sets the password, and logs the user in.
+    If the form is valid, it creates a new user and logs them in directly, without authenticating the password
+    it has just set. The password is hashed exactly once, in a thread pool (see amake_password), so under ASGI
+    the key derivation does not block the event loop.
     The user is then redirected to the 'verify_email' page.
     If the request method is GET, it initializes an empty UserRegisterForm.
     The form is then passed to the 'registration/signup.html' template for rendering.
@@ -115,137 +192,171 @@ def sign_up(request):
     """
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
-        if form.is_valid():
-            user = form.save(commit=False)
-            password = form.cleaned_data.get('password1')
-            user.set_password(password)
-            user.save()
-            new_user = authenticate(email=user.email, password=password)
-            login(request, new_user)
-            return redirect('verify_email')
+        if await sync_to_async(form.is_valid)():
+            try:
+                user = await form.asave()
+            except IntegrityError:
+                # another signup took the email between the uniqueness check and the insert
+                form.add_error('email', form.fields['email'].error_messages['unique'])
+            else:
+                await alogin(request, user)
+                return redirect('verify_email')
 
     else:
         form = UserRegisterForm()
+    await aload_user(request)
     return render(request, 'registration/signup.html', {'form': form})
 
 
-@login_required(login_url='/library/login')
-def account(request):
+async def account(request):
     """
     View function for handling user account information.
 
     This view function handles GET requests for displaying user account information.
     It updates the user's balance, initializes a FilterReservationsForm using the GET data,
-    and retrieves reservations and checked out books related to the user.
-    The retrieved data is then filtered based on the form input (if valid).
-    XML content is generated for reservations and checked out books, and XSLT stylesheets are loaded.
+    and renders the user's reservations and checked out books filtered based on the form input (if valid)
+    with arender_account_history.
+    The rendered history is cached per reader and filter combination until the reader's reservations,
+    checked out books or balance change (see library.fragments.aaccount_history).
     The transformed HTML content is passed to the 'account.html' template for rendering.
+    Anonymous users are redirected to the login page, as login_required does not support async views in Django 5.0.
 
     :param request: (HttpRequest) The HTTP request object.
     :return: The rendered HTML response containing the 'account.html' template with user account information.
     """
-    request.user.update_balance()
+    user = await aload_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    await sync_to_async(user.update_balance)()
     form = FilterReservationsForm(request.GET)
-    reservations = Reservation.objects.all()
-    checked_out_books = CheckedOutBook.objects.all()
-    reservations = reservations.filter(reader=request.user)
-    checked_out_books = checked_out_books.filter(reader=request.user, end_date__lte=timezone.now().date())
+    from_date = to_date = None
+    only_active = False
 
     if form.is_valid():
         from_date = form.cleaned_data.get('from_date')
         to_date = form.cleaned_data.get('to_date')
         only_active = form.cleaned_data.get('only_active')
 
-        if from_date and to_date:
-            reservations = reservations.filter(
-                start_date__lte=to_date,
-                end_date__gte=from_date,
-            )
-        if only_active:
-            reservations = reservations.filter(
-                is_active=True,
-            )
-
-    xml_content_res = generate_xml(reservations, True)
-    xml_content_check = generate_xml(checked_out_books, False)
-    with open("library\\static\\reservations.xslt", encoding='utf-8') as file:
-        xslt_content_res = file.read()
-    with open("library\\static\\checked_out_books.xslt", encoding='utf-8') as file:
-        xslt_content_check = file.read()
-    result_html_res = transform_xml(xml_content_res, xslt_content_res)
-    result_html_check = transform_xml(xml_content_check, xslt_content_check)
+    filters = (from_date, to_date, only_active)
+    result_html_res, result_html_check = await aaccount_history(
+        user.pk, filters, lambda: arender_account_history(user, *filters))
 
     return render(request, 'account.html', {'result_html_res' : result_html_res,
                                             'form' : form,
                                             'result_html_check' : result_html_check})
 
 
-def generate_xml(data, is_reservation):
+async def arender_account_history(reader, from_date, to_date, only_active):
+    """
+    Render the reservations and returned books of a reader as HTML.
+
+    XML trees are generated for reservations and checked out books and transformed with the cached,
+    precompiled XSLT stylesheets. The transforms run in the bounded xslt_executor, so they do not block
+    the event loop.
+
+    :param reader: (Reader) The reader whose history is rendered.
+    :param from_date: (date) Start of the date range of shown reservations, used together with to_date.
+    :param to_date: (date) End of the date range of shown reservations, used together with from_date.
+    :param only_active: (bool) Whether to show only active reservations.
+    :return: Tuple (result_html_res, result_html_check) of HTML strings.
+    """
+    reservations = Reservation.objects.filter(reader=reader)
+    checked_out_books = CheckedOutBook.objects.filter(reader=reader, end_date__lte=timezone.now().date())
+
+    if from_date and to_date:
+        reservations = reservations.filter(
+            start_date__lte=to_date,
+            end_date__gte=from_date,
+        )
+    if only_active:
+        reservations = reservations.filter(
+            is_active=True,
+        )
+
+    xml_tree_res = await agenerate_xml(reservations, True)
+    xml_tree_check = await agenerate_xml(checked_out_books, False)
+    return tuple(await asyncio.gather(atransform_xml(xml_tree_res, RESERVATIONS_XSLT),
+                                      atransform_xml(xml_tree_check, CHECKED_OUT_BOOKS_XSLT)))
+
+
+RESERVATION_XML_FIELDS = ('start_date', 'end_date', 'is_active', 'should_remind', 'add_info')
+CHECKED_OUT_BOOK_XML_FIELDS = ('start_date', 'due_date', 'end_date', 'is_penalty_paid')
+
+
+async def agenerate_xml(data, is_reservation):
     """
-    Generate XML content based on the provided data.
+    Generate an XML tree based on the provided data.
 
-    This function takes a list of data objects and a flag indicating whether the data represents reservations.
-    It iterates over the data and constructs XML content accordingly.
+    This function takes a queryset of data objects and a flag indicating whether the data represents reservations.
+    Rows are fetched together with their books (and, for checked out books, their penalties computed by the
+    database) in a single query and streamed from the database in chunks with the async ORM, and an element is
+    appended to the tree for each of them, so text content is escaped by lxml.
     If 'is_reservation' is True, it generates XML for reservations; otherwise, it generates XML for checked out books.
 
-    :param data: List of data objects (Reservation or CheckedOutBook).
+    :param data: QuerySet of data objects (Reservation or CheckedOutBook).
     :param is_reservation: Flag indicating whether the data represents reservations.
-    :return: XML content as a string.
+    :return: Root element of the generated XML tree.
     """
     if is_reservation:
-        xml_content = "<reservations>\n"
-        for reservation in data:
-            xml_content += f"\t<reservation>\n\t\t<book>{reservation.book}</book>\n\t\t"
-            xml_content += f"<start_date>{reservation.start_date}</start_date>\n\t\t"
-            xml_content += f"<end_date>{reservation.end_date}</end_date>\n\t\t"
-            xml_content += f"<is_active>{reservation.is_active}</is_active>\n\t\t"
-            xml_content += f"<should_remind>{reservation.should_remind}</should_remind>\n\t\t"
-            xml_content += f"<add_info>{reservation.add_info}</add_info>\n\t</reservation>\n"
-        xml_content += "</reservations>"
+        root = etree.Element('reservations')
+        row_tag, fields = 'reservation', RESERVATION_XML_FIELDS
     else:
-        xml_content = "<checked_out_books>\n"
-        for checked_out_book in data:
-            xml_content += f"\t<checked_out_book>\n\t\t<book>{checked_out_book.book}</book>\n\t\t"
-            xml_content += f"<start_date>{checked_out_book.start_date}</start_date>\n\t\t"
-            xml_content += f"<due_date>{checked_out_book.due_date}</due_date>\n\t\t"
-            xml_content += f"<end_date>{checked_out_book.end_date}</end_date>\n\t\t"
-            xml_content += f"<is_penalty_paid>{checked_out_book.is_penalty_paid}</is_penalty_paid>\n\t\t"
-            xml_content += f"<penalty>{checked_out_book.calculate_penalty()}</penalty>\n\t</checked_out_book>\n"
-        xml_content += "</checked_out_books>"
-    return xml_content
+        root = etree.Element('checked_out_books')
+        row_tag, fields = 'checked_out_book', CHECKED_OUT_BOOK_XML_FIELDS
+        data = data.with_penalty()
 
+    async for obj in data.select_related('book').aiterator():
+        row = etree.SubElement(root, row_tag)
+        etree.SubElement(row, 'book').text = str(obj.book)
+        for field in fields:
+            etree.SubElement(row, field).text = str(getattr(obj, field))
+        if not is_reservation:
+            etree.SubElement(row, 'penalty').text = str(obj.penalty)
+    return root
 
-def transform_xml(xml_string, xslt_string):
+
+def transform_xml(xml_tree, transform):
     """
     Transform XML content using XSLT stylesheet.
 
-    This function takes an XML string and an XSLT string, performs the transformation,
+    This function takes an XML tree and a compiled XSLT stylesheet, performs the transformation,
     and returns the resulting HTML content as a string.
 
-    :param xml_string: XML content as a string.
-    :param xslt_string: XSLT stylesheet as a string.
+    :param xml_tree: XML tree (element or element tree), as returned by agenerate_xml.
+    :param transform: Compiled XSLT stylesheet (etree.XSLT), usually obtained from xslt_registry.
     :return: Transformed HTML content as a string.
     """
-    xml_tree = etree.fromstring(xml_string.encode('utf-8'))
-    xslt_tree = etree.fromstring(xslt_string.encode('utf-8'))
-    transform = etree.XSLT(xslt_tree)
     result_tree = transform(xml_tree)
     result_html = etree.tostring(result_tree, pretty_print=True, encoding='utf-8').decode('utf-8')
     return result_html
 
 
+async def atransform_xml(xml_tree, stylesheet):
+    """
+    Transform XML content with the stylesheet at the given path in the bounded xslt_executor, so that the
+    transform does not block the event loop.
+
+    :param xml_tree: XML tree, as returned by agenerate_xml.
+    :param stylesheet: (Path) Path of the XSLT stylesheet, e.g. RESERVATIONS_XSLT.
+    :return: Transformed HTML content as a string.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        xslt_executor, lambda: transform_xml(xml_tree, xslt_registry.get(stylesheet)))
+
+
 def verify_email(request):
     """
     View function for handling email verification.
 
     This view function handles both GET and POST requests for email verification.
-    If the request method is POST and the user's email is not verified, it sends a verification email.
+    If the request method is POST and the user's email is not verified, it queues a verification email in the
+    outbox, from which it is sent by the send_outbox command.
     The verification email includes a link with a unique token to confirm the user's email.
     If the user's email is already verified, they are redirected to the 'sign_up' page.
     If the request method is GET, it renders the 'verify_email/verify_email.html' template.
 
-    :param request: (HttpRequest) The HTTP request object. :return: Redirects to 'verify_email_done' if a
-    verification email is sent successfully. Redirects to 'sign_up' if the user's email is  already verified. Renders
+    :param request: (HttpRequest) The HTTP request object. :return: Redirects to 'verify_email_done' once the
+    verification email is queued. Redirects to 'sign_up' if the user's email is  already verified. Renders
     'verify_email/verify_email.html' template for GET requests.
     """
     if request.method == "POST":
@@ -261,11 +372,7 @@ def verify_email(request):
                 'uid': urlsafe_base64_encode(force_bytes(user.pk)),
                 'token': account_activation_token.make_token(user),
             })
-            email = EmailMessage(
-                subject, message, to=[email]
-            )
-            email.content_subtype = 'html'
-            email.send()
+            OutboxEmail.objects.enqueue(subject, message, [email], content_subtype='html')
             return redirect('verify_email_done')
         else:
             return redirect('sign_up')
@@ -308,3 +415,175 @@ def verify_email_confirm(request, uidb64, token):
 
 def verify_email_complete(request):
     return render(request, 'verify_email/verify_email_complete.html')
+
+
+def metrics(request):
+    """
+    View function exposing the application metrics in the Prometheus text format.
+
+    The endpoint is meant to be scraped by Prometheus, which authenticates with the 'Authorization: Bearer
+    <settings.METRICS_TOKEN>' header; staff members can open it in their browser as well. It is only routed when
+    settings.METRICS_ENABLED is set.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :return: HttpResponse with the metrics of all worker processes, or a 401 response for other clients.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+            or request.user.is_staff):
+        response = HttpResponse('Authentication required.', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+@staff_member_required
+def export(request, name):
+    """
+    View function streaming an export of books, reservations or checked out books to staff members.
+
+    The 'format' GET parameter chooses CSV (default) or JSON Lines, and reservations and checked out books can be
+    filtered with the 'from_date', 'to_date' and 'only_active' parameters of FilterReservationsForm. Rows are
+    read from the database in chunks while the response is being sent (see export_rows), so memory use does not
+    depend on the number of rows. An ASGI server consumes a synchronous stream by loading it into memory first,
+    so requests served by one get an async stream (see aexport_rows) instead.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :param name: (str) Name of the export: 'books', 'reservations' or 'checked-out-books'.
+    :return: StreamingHttpResponse with the export as an attachment, or a 400 response for invalid parameters.
+    """
+    if name not in EXPORTS:
+        raise Http404('Unknown export.')
+    form = ExportFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain')
+
+    file_format = form.cleaned_data['format'] or 'csv'
+    encoder, content_type = EXPORT_FORMATS[file_format]
+    filters = (form.cleaned_data['from_date'], form.cleaned_data['to_date'], form.cleaned_data['only_active'])
+    if isinstance(request, ASGIRequest):
+        content = astream_export(encoder, *aexport_rows(name, *filters))
+    else:
+        content = stream_export(encoder, *export_rows(name, *filters))
+    response = StreamingHttpResponse(content, content_type=content_type)
+    filename = f'{name}-{timezone.now():%Y%m%d}.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+API_BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'publisher', 'pub_year', 'image_url', 'is_available', 'updated_at')
+MAX_API_PAGE_SIZE = 100
+
+
+def parse_api_fields(request):
+    """
+    Read the fields requested in the comma-separated 'fields' GET parameter.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :return: Tuple of field names, all of API_BOOK_FIELDS when the parameter is missing.
+    :raises ValueError: If an unknown field is requested.
+    """
+    fields = tuple(dict.fromkeys(field.strip() for field in request.GET.get('fields', '').split(',') if field.strip()))
+    unknown = [field for field in fields if field not in API_BOOK_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Available fields: {", ".join(API_BOOK_FIELDS)}.')
+    return fields or API_BOOK_FIELDS
+
+
+def conditional_json(request, updated_at, data_func):
+    """
+    Answer a conditional GET with 304 Not Modified, or build the JSON response with ETag and Last-Modified headers.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :param updated_at: (datetime) Time of the last change of the served data.
+    :param data_func: (callable) Called without arguments to build the response data if it is needed.
+    :return: HttpResponseNotModified or JsonResponse.
+    """
+    etag = quote_etag(f'{updated_at.timestamp():.6f}')
+    last_modified = int(updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(data_func())
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    return response
+
+
+@require_safe
+def api_books(request):
+    """
+    API view returning one page of books matching the 'q' GET parameter as JSON.
+
+    Books are serialized with .values() and contain the 'id' and the fields listed in the 'fields' GET parameter
+    (all fields by default). Pages are addressed with the opaque 'next_cursor' and 'prev_cursor' values returned
+    with every page, passed back in the 'cursor' parameter; 'page_size' sets the number of books, up to
+    MAX_API_PAGE_SIZE.
+
+    ETag and Last-Modified are based on the latest Book.updated_at in the catalog, so polling clients get a 304
+    response after a single indexed query while no book has changed. Deleted books are not detected by them and
+    stay in cached pages until another book changes.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :return: JsonResponse with 'results', 'next_cursor' and 'prev_cursor', 304 or a 400 response.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'The q parameter is required.'}, status=400)
+    try:
+        fields = parse_api_fields(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    page_size = request.GET.get('page_size')
+    if page_size is not None:
+        if not page_size.isdigit() or int(page_size) < 1:
+            return JsonResponse({'error': 'page_size must be a positive number.'}, status=400)
+        page_size = min(int(page_size), MAX_API_PAGE_SIZE)
+    updated_at = Book.objects.aggregate(updated_at=Max('updated_at'))['updated_at'] or timezone.now()
+
+    def page_data():
+        page = search_books(query, cursor=request.GET.get('cursor'), page_size=page_size, fields=fields)
+        return {'results': page.books, 'next_cursor': page.next_cursor, 'prev_cursor': page.prev_cursor}
+
+    return conditional_json(request, updated_at, page_data)
+
+
+@require_safe
+def api_book(request, book_id):
+    """
+    API view returning a single book as JSON, with its 'id' and the fields listed in the 'fields' GET parameter.
+
+    ETag and Last-Modified are based on Book.updated_at of the book.
+
+    :param request: (HttpRequest) The HTTP request object.
+    :param book_id: (int) The ID of the book.
+    :return: JsonResponse with the book, 304, or a 400 or 404 response.
+    """
+    try:
+        fields = parse_api_fields(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    book = Book.objects.filter(pk=book_id).values(*dict.fromkeys(('id', *fields, 'updated_at'))).first()
+    if book is None:
+        return JsonResponse({'error': 'Book not found.'}, status=404)
+    updated_at = book['updated_at'] if 'updated_at' in fields else book.pop('updated_at')
+    return conditional_json(request, updated_at, lambda: book)
+
+
+MAX_AUTOCOMPLETE_SUGGESTIONS = 20
+
+
+@require_safe
+def autocomplete(request):
+    """
+    API view returning titles and authors starting with the 'q' GET parameter, for search-as-you-type.
+
+    Suggestions come from the in-process AutocompleteIndex, so answering them does not query the database.
+    The 'limit' GET parameter sets the maximum number of titles and of authors (default 8).
+
+    :param request: (HttpRequest) The HTTP request object.
+    :return: JsonResponse with 'titles' (id, title and author of books) and 'authors'.
+    """
+    limit = request.GET.get('limit', '8')
+    limit = min(int(limit), MAX_AUTOCOMPLETE_SUGGESTIONS) if limit.isdigit() else 8
+    return JsonResponse(autocomplete_index.suggest(request.GET.get('q', ''), limit=limit))
@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from lxml import etree
+
+from .metrics import record_cache
+
+XSLT_DIR = settings.BASE_DIR / 'library' / 'static'
+RESERVATIONS_XSLT = XSLT_DIR / 'reservations.xslt'
+CHECKED_OUT_BOOKS_XSLT = XSLT_DIR / 'checked_out_books.xslt'
+DEFAULT_XSLT_MAX_WORKERS = 4
+
+
+class XSLTRegistry:
+    """
+    Process-wide registry of compiled XSLT stylesheets.
+
+    Stylesheets are parsed and compiled into etree.XSLT objects once and reused by every request served by the
+    process. Entries are keyed by stylesheet path and remember the file's modification time, so an edited
+    stylesheet is recompiled on its next use.
+
+    Methods:
+        - get(path): Returns the compiled transform for the stylesheet at the given path.
+        - clear(): Drops all compiled transforms.
+
+    Example Usage:
+    transform = xslt_registry.get(RESERVATIONS_XSLT)
+    result_tree = transform(xml_tree)
+
+    Note:
+        - Lookups of an up-to-date entry do not take the lock; compilation is serialized so that concurrent
+          threads never compile the same stylesheet twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transforms = {}
+
+    def get(self, path):
+        """
+        Return the compiled transform for a stylesheet, compiling it if it is missing or stale.
+
+        :param path: (str or Path) Path of the XSLT stylesheet.
+        :return: transform (etree.XSLT): The compiled stylesheet.
+        """
+        path = os.fspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._transforms.get(path)
+        hit = entry is not None and entry[0] == mtime
+        record_cache('xslt', hit)
+        if not hit:
+            with self._lock:
+                entry = self._transforms.get(path)
+                if entry is None or entry[0] != mtime:
+                    entry = (mtime, etree.XSLT(etree.parse(path)))
+                    self._transforms[path] = entry
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._transforms.clear()
+
+
+xslt_registry = XSLTRegistry()
+
+
+# async views run XSLT transforms here instead of blocking the event loop; the pool is bounded, so a burst of
+# account pages queues up instead of starting a thread per request
+xslt_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'XSLT_MAX_WORKERS', DEFAULT_XSLT_MAX_WORKERS),
+                                   thread_name_prefix='xslt')
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,8 +49,59 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library.middleware.SQLInstrumentationMiddleware',
 ]
 
+# per-request SQL statistics (query count, DB time, repeated statements) in Server-Timing headers
+# and the 'library.sql' logger - disabled by default, enable e.g. in staging
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+SQL_REPEATED_QUERY_THRESHOLD = 5
+
+# Prometheus metrics served at /metrics - disabled by default; the endpoint is served to staff members and to
+# requests with the 'Authorization: Bearer <METRICS_TOKEN>' header (bearer_token in the Prometheus scrape config)
+# - when running several worker processes (e.g. gunicorn), set the PROMETHEUS_MULTIPROC_DIR environment variable
+# to an empty directory shared by the workers and wipe it before every server start, so that the metrics of all
+# workers are aggregated
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# cache of rendered book fragments - fragments are invalidated by whichever process changes a book (a web worker,
+# the admin, a management command), so with several processes the cache has to be shared between them, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache CACHE_LOCATION=127.0.0.1:11211
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # rendered account histories, kept per process and bounded - LocMemCache evicts the least recently used
+    # entries once MAX_ENTRIES is reached; their validity is checked against reader versions in the default cache
+    'account': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'account-history',
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
+    },
+}
+# a cache kept in process memory never sees the invalidations of other processes, so fragments and versions are
+# only kept for LOCAL_FRAGMENT_TIMEOUT seconds unless the default cache is shared
+CACHE_IS_SHARED = CACHES['default']['BACKEND'] not in ('django.core.cache.backends.locmem.LocMemCache',
+                                                       'django.core.cache.backends.dummy.DummyCache')
+if not CACHE_IS_SHARED:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+BOOK_FRAGMENT_TIMEOUT = 60 * 60 * 24
+LOCAL_FRAGMENT_TIMEOUT = 5
+ACCOUNT_HISTORY_TIMEOUT = 60 * 60 * 24
+# seconds after which each process rebuilds its in-memory autocomplete index in the background, picking up
+# book changes made by other processes (changes made by the process itself are applied immediately)
+AUTOCOMPLETE_MAX_AGE = 15 * 60
+# with a shared default cache, sessions and the readers of authenticated sessions are read from it, so logged-in
+# requests do not query the database before the view runs; a session ended or a password changed in one process
+# would stay valid in the others until it expired from their own cache, so a process-local cache keeps both in
+# the database
+if CACHE_IS_SHARED:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['library.auth.CachedReaderBackend']
+READER_CACHE_TIMEOUT = 5 * 60
+
 ROOT_URLCONF = 'wap_project.urls'
 
 TEMPLATES = [
@@ -76,12 +128,26 @@ WSGI_APPLICATION = 'wap_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite starting transactions with BEGIN IMMEDIATE, so concurrent writers wait instead of failing
+        'ENGINE': 'library.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # the app is served with ASGI, where Django does not reuse connections between requests; a WSGI
+        # deployment can keep them open between the requests of a worker thread with DB_CONN_MAX_AGE=600
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            # a file database (instead of the shared in-memory one) lets concurrency tests
+            # use connections from several threads with regular SQLite locking
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# the pragmas applied to every new SQLite connection are library.backends.sqlite3.base.DEFAULT_SQLITE_PRAGMAS;
+# define SQLITE_PRAGMAS here to replace them
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
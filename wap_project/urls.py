@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from library import views as library_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('library/', include('library.urls'))
+    path('library/', include('library.urls')),
 ]
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics', library_views.metrics, name='metrics'))